@@ -0,0 +1,255 @@
+"""离线基准测试
+
+使用 fixtures/ 中录制的上游响应 (不访问网络), 测量:
+  - 各数据源的解析耗时 (GitHub/知乎网页按每个可用的解析后端分别测量)
+  - generate_html 在不同条目数量和主题下的渲染耗时
+  - main() 的端到端耗时 (包含并发获取、Pixiv 图片下载、渲染和写文件)
+
+结果以 JSON 输出, 便于在不同提交之间比较:
+    python benchmark.py -o bench.json
+    python benchmark.py --compare bench.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import daily_new
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BASE_DIR, "fixtures")
+RENDER_ITEM_COUNTS = [10, 50, 100, 500]
+
+# 解析基准: 名称 -> (录制的URL, 解析函数)
+PARSE_CASES = {
+    "github": ("https://github.com/trending?since=daily&spoken_language_code=zh",
+               lambda body: daily_new.parse_github_trending(body.decode("utf-8"), 25)),
+    "bilibili": ("https://api.bilibili.com/x/web-interface/popular",
+                 lambda body: daily_new.parse_bilibili_hot(json.loads(body), 50)),
+    "weibo": ("https://weibo.com/ajax/side/hotSearch",
+              lambda body: daily_new.parse_weibo_hot(json.loads(body), 50)),
+    "zhihu_api": ("https://www.zhihu.com/api/v3/feed/topstory/hot-lists/total?limit=50",
+                  lambda body: daily_new.parse_zhihu_api(json.loads(body), 50)),
+    "zhihu_billboard": ("https://www.zhihu.com/billboard",
+                        lambda body: daily_new.parse_zhihu_billboard(body.decode("utf-8"), 50)),
+    "pixiv": ("https://www.pixiv.net/ranking.php?mode=monthly",
+              lambda body: daily_new.parse_pixiv_ranking_page(body.decode("utf-8"), 50)),
+}
+# 结果依赖解析后端的用例
+BACKEND_CASES = {"github"}
+
+# extract_embedded_json 的正确性检查: (名称, 页面片段, marker, 参数, 期望结果)
+EXTRACT_CHECKS = [
+    ("brace_in_string", 'window.__INITIAL_STATE__ = {"a": "x}y", "b": [1]};</script>',
+     "window.__INITIAL_STATE__", {}, {"a": "x}y", "b": [1]}),
+    ("wrong_brace", 'window.__INITIAL_STATE__ = null;</script><script>var cfg = {"ads": 1}',
+     "window.__INITIAL_STATE__", {}, None),
+    ("missing_object", "<html><body>no state here</body></html>", "window.__INITIAL_STATE__", {}, None),
+    ("condition_before_assignment", 'if (window.__INITIAL_STATE__) {x()}; window.__INITIAL_STATE__ = {"a":1}',
+     "window.__INITIAL_STATE__", {}, {"a": 1}),
+    ("property_before_assignment", 'window.__INITIAL_STATE__.foo = 1; window.__INITIAL_STATE__ = {"a":1}',
+     "window.__INITIAL_STATE__", {}, {"a": 1}),
+    ("tag_attribute", '<script id="js-initialData" type="text/json">{"initialState": {}}</script>',
+     'id="js-initialData"', {"in_tag": True}, {"initialState": {}}),
+    ("tag_without_object", '<div id="js-initialData"></div><script>{"ads": 1}</script>',
+     'id="js-initialData"', {"in_tag": True}, None),
+]
+
+
+def measure(name: str, func: Callable[[], object], iterations: int, **extra) -> Dict:
+    """预热一次后重复执行 iterations 次, 返回耗时统计 (毫秒)"""
+    func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "name": name,
+        "iterations": iterations,
+        "mean_ms": round(statistics.mean(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+        "stdev_ms": round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+        **extra
+    }
+
+
+def available_backends() -> List[str]:
+    backends = ["html.parser"]
+    if daily_new.LXML_AVAILABLE:
+        backends.append("lxml")
+    if daily_new.SelectolaxParser is not None:
+        backends.append("selectolax")
+    return backends
+
+
+def configure_offline(work_dir: str) -> None:
+    """关闭所有跨运行缓存, 并让HTTP请求从 fixtures 回放"""
+    config = daily_new.CONFIG
+    config["http_cache"]["enabled"] = False
+    config["snapshot_cache"]["enabled"] = False
+    config["fragment_cache"]["enabled"] = False
+    # 回放不需要保护上游: 关闭限流和熔断, 避免等待时间混入测量结果
+    config["rate_limits"] = {"default": {"rate": None, "max_in_flight": 64}}
+    config["circuit_breaker"]["enabled"] = False
+    config["sources"] = {source: True for source in config["sources"]}
+    config["output_file"] = os.path.join(work_dir, "daily_news.html")
+    config["css_dir"] = os.path.join(work_dir, "static", "css")
+    daily_new.install_replay_adapter(FIXTURES_DIR)
+
+
+def check_extractor() -> None:
+    """计时前先确认 extract_embedded_json 的结果正确, 出错时直接失败"""
+    for name, text, marker, kwargs, expected in EXTRACT_CHECKS:
+        result = daily_new.extract_embedded_json(text, marker, **kwargs)
+        assert result == expected, f"extract_embedded_json[{name}]: 期望 {expected!r}, 得到 {result!r}"
+
+
+def bench_parsers(store: daily_new.ResponseStore, iterations: int) -> List[Dict]:
+    results = []
+    for case, (url, parse) in PARSE_CASES.items():
+        recorded = store.load(url)
+        if recorded is None:
+            print(f"缺少录制数据, 跳过 {case}: {url}", file=sys.stderr)
+            continue
+        body = recorded[2]
+        backends = available_backends() if case in BACKEND_CASES else [None]
+        for backend in backends:
+            if backend is not None:
+                daily_new.CONFIG["parser"] = backend
+            items = parse(body)
+            assert items, f"parse.{case}: 录制数据没有解析出条目"
+            results.append(measure(
+                f"parse.{case}" + (f".{backend}" if backend else ""),
+                lambda: parse(body), iterations,
+                bytes=len(body), items=len(items or [])
+            ))
+    daily_new.CONFIG["parser"] = "auto"
+    return results
+
+
+def load_fixture_data(store: daily_new.ResponseStore) -> Dict[str, List]:
+    """从录制数据解析出各数据源的条目, 作为渲染基准的输入"""
+    data = {}
+    for source, case in [("github", "github"), ("bilibili", "bilibili"), ("weibo", "weibo"), ("zhihu", "zhihu_api")]:
+        url, parse = PARSE_CASES[case]
+        data[source] = parse(store.load(url)[2])
+    illusts = PARSE_CASES["pixiv"][1](store.load(PARSE_CASES["pixiv"][0])[2])
+    data["pixiv"] = [daily_new.PixivArtwork(
+        title=item["title"], url=f"https://www.pixiv.net/artworks/{item['illustId']}",
+        image_url=f"images/{item['illustId']}.jpg", author=item["user_name"],
+        author_url=f"https://www.pixiv.net/users/{item['user_id']}",
+        width=item["width"], height=item["height"], bookmarks=item["bookmarks"]
+    ) for item in illusts]
+    return data
+
+
+def bench_render(store: daily_new.ResponseStore, iterations: int) -> List[Dict]:
+    base = load_fixture_data(store)
+    results = []
+    for count in RENDER_ITEM_COUNTS:
+        # 循环复用录制的条目, 凑够 count 条
+        data = {source: [items[i % len(items)] for i in range(count)] for source, items in base.items()}
+        for theme in daily_new.THEMES:
+            for inline_css in (False, True):
+                config = dict(daily_new.CONFIG, theme=theme, inline_css=inline_css)
+                html = daily_new.generate_html(data, config)
+                results.append(measure(
+                    f"render.{theme}.{'inline' if inline_css else 'linked'}.{count}",
+                    lambda: daily_new.generate_html(data, config), iterations,
+                    items_per_source=count, bytes=len(html.encode("utf-8"))
+                ))
+    return results
+
+
+def bench_main(work_dir: str, iterations: int) -> List[Dict]:
+    def run():
+        # 每次都在新目录中运行, 保证 Pixiv 图片真正被下载
+        with tempfile.TemporaryDirectory(dir=work_dir) as run_dir:
+            cwd = os.getcwd()
+            os.chdir(run_dir)
+            try:
+                with redirect_stdout(io.StringIO()):
+                    daily_new.main()
+            finally:
+                os.chdir(cwd)
+    return [measure("main.end_to_end", run, iterations)]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(baseline_path: str, report: Dict) -> None:
+    """打印与基线报告相比的耗时变化"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"{'name':<40} {'baseline':>12} {'current':>12} {'change':>8}", file=sys.stderr)
+    for result in report["results"]:
+        old = baseline.get(result["name"])
+        if old is None or not old["median_ms"]:
+            continue
+        change = (result["median_ms"] - old["median_ms"]) / old["median_ms"] * 100
+        print(f"{result['name']:<40} {old['median_ms']:>10.3f}ms {result['median_ms']:>10.3f}ms {change:>+7.1f}%",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="daily_new.py 离线基准测试")
+    parser.add_argument("-n", "--iterations", type=int, default=10, help="每项重复次数 (默认 10)")
+    parser.add_argument("-o", "--output", help="把 JSON 结果写入文件 (默认输出到标准输出)")
+    parser.add_argument("--compare", metavar="BASELINE", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--only", choices=["parse", "render", "main"], action="append",
+                        help="只运行指定的基准 (可重复)")
+    args = parser.parse_args()
+    suites = args.only or ["parse", "render", "main"]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure_offline(work_dir)
+        store = daily_new.ResponseStore(FIXTURES_DIR)
+        results = []
+        if "parse" in suites:
+            check_extractor()
+            results += bench_parsers(store, args.iterations)
+        if "render" in suites:
+            results += bench_render(store, args.iterations)
+        if "main" in suites:
+            results += bench_main(work_dir, max(1, args.iterations // 5))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parser_backends": available_backends()
+        },
+        "results": results
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
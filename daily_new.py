@@ -1,13 +1,69 @@
+import argparse
+import gzip
+import hashlib
+import multiprocessing
 import os
+import pickle
 import random
+import shutil
+import signal
+import socket
+import sqlite3
+import time
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import json
-from datetime import datetime
-from dataclasses import dataclass
-from typing import List, Dict
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from dataclasses import asdict, dataclass
+from typing import List, Dict, Callable, Tuple, Optional, Set
 import re
+import string
+from functools import lru_cache
+from pathlib import Path
+from html import escape as html_escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:  # 可选的快速HTML解析器
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    try:  # 旧版本 selectolax 只有 modest 后端
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    except ImportError:
+        SelectolaxParser = None
+
+try:
+    import lxml  # noqa: F401
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:  # 安装 brotli 后 urllib3 才能解压 br 编码的响应, 内置服务器也会提供 br 压缩版本
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi as brotli
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+try:  # 可选: 安装 Pillow 后为 Pixiv 图片生成卡片尺寸的缩略图
+    from PIL import Image, ImageOps, features as pil_features
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
 
 # =============== 配置区域 ===============
 CONFIG = {
@@ -15,6 +71,159 @@ CONFIG = {
     "output_file": "daily_news.html",  # 输出HTML文件名
     "title": "每日热门内容聚合",        # HTML标题
     "theme": "default",               # 样式主题 (default/dark/green/classic)
+    "fetch_workers": 5,               # 并发获取数据源的线程数 (1表示顺序获取)
+    "parser": "auto",                 # HTML解析后端 (auto/selectolax/lxml/html.parser), auto按速度优先选择已安装的
+    "inline_css": False,              # True时把CSS内联到HTML中, False时引用独立的样式文件
+    "css_dir": os.path.join("static", "css"),  # 主题样式文件目录 (文件名含内容哈希, 可长期缓存)
+
+    # 超时配置 (秒)
+    "timeouts": {
+        "connect": 5,                 # 建立连接的超时
+        "read": 15,                   # 两次收到数据之间的最长间隔
+        "sources": {                  # 按数据源覆盖, 例如 "pixiv": {"read": 30}
+            "pixiv": {"read": 30}
+        }
+    },
+    "run_deadline": 90,               # 整次运行获取数据的截止时间, 到时用已完成的数据生成页面 (None表示不限制)
+
+    # 重试配置 (超时、连接错误、5xx、429 时按指数退避加随机抖动重试)
+    "retry": {
+        "max_attempts": 3,            # 每个请求最多尝试的次数 (1表示不重试)
+        "backoff_base": 0.5,          # 第一次重试前的最长等待 (秒), 之后每次翻倍
+        "backoff_max": 8,             # 单次等待上限 (秒), 429 的 Retry-After 超过该值时不再重试
+        "statuses": [429, 500, 502, 503, 504]
+    },
+
+    # 熔断器 (按主机): 连续失败达到阈值后, 冷却期内直接跳过该主机, 状态跨运行保存
+    "circuit_breaker": {
+        "enabled": True,
+        "failure_threshold": 3,       # 连续失败多少次后熔断
+        "cooldown": 300,              # 熔断持续时间 (秒)
+        "state_file": os.path.join(".cache", "circuit_breakers.json")
+    },
+
+    # 按主机限流: 令牌桶 (rate 每秒请求数, burst 突发容量) + 同时进行的请求数上限
+    # 页面请求与图片下载共用, rate 为 None 表示不限速
+    "rate_limits": {
+        "default": {"rate": 10, "burst": 10, "max_in_flight": 8},
+        "hosts": {
+            "www.pixiv.net": {"rate": 1, "burst": 2, "max_in_flight": 2},
+            "i.pximg.net": {"rate": 5, "burst": 8, "max_in_flight": 4},
+            "weibo.com": {"rate": 1, "burst": 2, "max_in_flight": 1}
+        }
+    },
+
+    # HTTP连接池配置 (所有数据源和图片下载共用一个会话)
+    "http": {
+        "pool_connections": 10,       # 缓存连接池的主机数量
+        "pool_maxsize": 16            # 每个主机保持的最大连接数
+    },
+
+    # 运行指标 (各阶段耗时、每个请求的 DNS/连接/首字节/下载耗时等)
+    "metrics": {
+        "enabled": True,
+        "json_file": "run_report.json",        # JSON运行报告
+        "prometheus_file": "daily_news.prom"   # Prometheus 文本格式 (可供 node_exporter textfile 采集)
+    },
+
+    # 常驻模式 (python daily_new.py --daemon): 每个数据源按自己的间隔刷新, 有变化时才重新生成页面
+    "daemon": {
+        "intervals": {                # 各数据源刷新间隔 (秒)
+            "weibo": 60,
+            "zhihu": 300,
+            "bilibili": 600,
+            "github": 3600,
+            "pixiv": 86400
+        },
+        "default_interval": 600,
+        "jitter": 0.1,                # 间隔的随机抖动比例 (±10%), 避免请求总是同时发出
+        "retry_delay": 30,            # 获取失败后首次重试的等待时间 (秒), 之后每次翻倍
+        "max_backoff": 3600,          # 失败重试的最长等待时间 (秒)
+        "poll_interval": 1.0          # 等待数据源完成时检查退出信号的间隔 (秒)
+    },
+
+    # 预压缩: 在输出文件旁写出 .gz / .br 版本, 供静态服务器直接发送 (如 nginx gzip_static / brotli_static)
+    "precompress": {
+        "enabled": True,
+        "formats": ["gzip", "br"],    # br 需要安装 brotli
+        "min_size": 256               # 小于该字节数的文件不压缩
+    },
+
+    # 内置服务器 (--serve): 常驻刷新, 页面保存在内存中并预先压缩
+    "serve": {
+        "host": "127.0.0.1",
+        "port": 8080,
+        "static_dirs": ["images", "static"],  # 允许从磁盘提供的目录 (相对输出文件所在目录), 只提供图片和样式文件
+        "static_cache_bytes": 64 * 1024 * 1024,  # 内存中缓存的磁盘文件总大小上限 (按最近使用淘汰)
+        "page_cache_control": "no-cache",     # 页面每次都用 ETag 验证
+        "asset_cache_control": "public, max-age=31536000, immutable",  # 文件名带内容哈希的样式文件
+        "feed_cache_control": "public, max-age=300",
+        "static_cache_control": "public, max-age=86400",
+        "verbose": False
+    },
+
+    # 录制与回放 (用于离线压测)
+    "record_dir": None,               # 设置目录后, 把收到的所有上游响应录制到该目录
+    "base_url": None,                 # 设置后所有请求改发到该地址 (例如本地回放服务器 http://127.0.0.1:8800)
+    "replay_server": {                # 本地回放服务器配置
+        "host": "127.0.0.1",
+        "port": 8800,
+        "latency_ms": 0,              # 人为增加的响应延迟
+        "jitter_ms": 0,               # 延迟的随机抖动范围 (±)
+        "error_rate": 0.0,            # 随机返回错误的比例 (0~1)
+        "error_status": 503           # 随机错误使用的状态码
+    },
+
+    # HTTP条件请求缓存 (ETag / Last-Modified, 跨运行保存响应和解析结果)
+    "http_cache": {
+        "enabled": True,
+        "dir": os.path.join(".cache", "http")
+    },
+
+    # 数据快照缓存 (按数据源和参数保存最近一次成功的结果)
+    # 未过期时直接使用; 过期后先返回旧数据, 同时在后台刷新
+    "snapshot_cache": {
+        "enabled": True,
+        "dir": os.path.join(".cache", "snapshots"),
+        "ttl": {                      # 各数据源快照有效期 (秒)
+            "github": 3600,
+            "bilibili": 600,
+            "weibo": 60,
+            "zhihu": 300,
+            "pixiv": 86400
+        },
+        "default_ttl": 600
+    },
+
+    # HTML区块缓存 (数据未变化的区块直接复用上次渲染的结果)
+    "fragment_cache": {
+        "enabled": True,
+        "dir": os.path.join(".cache", "fragments")
+    },
+
+    # 新条目标记: 记录见过的条目及其上次排名, 页面上标出 新上榜/上升/下降
+    "seen_index": {
+        "enabled": True,
+        "dir": os.path.join(".cache", "seen"),
+        "expiry_days": 7              # 超过该天数未再出现的条目被遗忘, 再出现时算作新条目
+    },
+
+    # 订阅源输出: 每个数据源及合并的 RSS 2.0 / Atom 文件, 只追加新条目
+    "feeds": {
+        "enabled": True,
+        "dir": "feeds",
+        "formats": ["rss", "atom"],
+        "max_entries": 50,            # 每个订阅源保留的条目数
+        "site_url": None,             # 页面的公开绝对地址, 用作订阅源的链接 (None则使用内置服务器地址或输出文件的 file: 地址)
+        "guid_expiry_days": 30,       # 超过该天数未再出现的条目被遗忘, 再出现时重新加入订阅源
+        "state_dir": os.path.join(".cache", "feeds")
+    },
+
+    # 历史归档: 每次运行获取到的条目写入 SQLite, 用于查询排名变化等趋势
+    "archive": {
+        "enabled": True,
+        "path": os.path.join("data", "archive.sqlite3")
+    },
 
     # 数据源配置 (True表示启用，False表示禁用)
     "sources": {
@@ -44,7 +253,28 @@ CONFIG = {
     },
     "pixiv": {
         "limit": 12,                # 获取的作品数量
-        "mode": "monthly"            # 排行榜类型 (daily/weekly/monthly)
+        "mode": "monthly",           # 排行榜类型 (daily/weekly/monthly)
+        "download_workers": 8,       # 并发下载图片的线程数
+        "image_timeout": 10,         # 单张图片下载超时 (秒)
+        "max_image_bytes": 20 * 1024 * 1024,  # 单张图片大小上限 (字节)
+        # 图片目录: 图片库在 <image_dir>/store, 按 作品ID/内容哈希 保存, 重复上榜的作品不再下载;
+        # 各日期目录 <image_dir>/<日期> 中只有引用 (refs.json)。内置服务器的 static_dirs 需包含该目录
+        "image_dir": "images",
+        # 图片库清理: 每次运行后按最久未被引用的顺序删除, 直到总大小不超过预算 (当前页面用到的图片不删除)
+        "image_cache": {
+            "enabled": True,
+            "max_bytes": 1024 * 1024 * 1024,  # 图片库 (含缩略图) 的磁盘预算
+            "max_age_days": 30,      # 超过该天数未被引用的图片和日期目录直接删除
+            "max_evictions": 500     # 每次运行最多删除的作品数, 其余留到下次
+        },
+        # 卡片尺寸缩略图 (需要 Pillow): 按卡片的 4:3 比例居中裁剪, 页面通过 <picture> 选择格式
+        "thumbnails": {
+            "enabled": True,
+            "widths": [400, 800],    # 1x / 2x 宽度
+            "formats": ["avif", "webp", "jpeg"],  # jpeg 为兜底格式, Pillow 不支持的格式自动跳过
+            "quality": {"avif": 55, "webp": 78, "jpeg": 82},
+            "workers": None          # 进程数, None表示CPU核数
+        }
     }
 }
 
@@ -97,6 +327,7 @@ class PixivArtwork:
     width: int
     height: int
     bookmarks: int
+    thumbnails: Dict[str, List] = None  # 格式 -> [[宽度, 路径], ...], 没有缩略图时为 None
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -114,8 +345,956 @@ def get_random_user_agent():
     """随机获取一个User-Agent"""
     return random.choice(USER_AGENTS)
 
+# =============== 运行指标 ===============
+class RunMetrics:
+    """收集一次运行中各阶段的耗时、每个HTTP请求的明细和计数, 导出为JSON报告和Prometheus文本格式"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = []
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        """累加某个阶段的耗时, 阶段名形如 "fetch.github" / "render" """
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_request(self, entry: Dict) -> None:
+        with self._lock:
+            self.requests.append(entry)
+
+    def merge(self, other: "RunMetrics") -> None:
+        """把另一个收集器的阶段耗时、计数和请求明细并入本次统计"""
+        with other._lock:
+            stages, counters, requests = dict(other.stages), dict(other.counters), list(other.requests)
+        with self._lock:
+            for name, seconds in stages.items():
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.requests.extend(requests)
+
+    def to_report(self) -> Dict:
+        with self._lock:
+            return {
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+                "duration_seconds": round(time.time() - self.started_at, 4),
+                "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                "counters": dict(self.counters),
+                "requests": list(self.requests)
+            }
+
+    def to_prometheus(self) -> str:
+        """按 Prometheus text exposition format 输出 (按主机汇总请求指标)"""
+        report = self.to_report()
+        hosts = {}
+        for entry in report["requests"]:
+            host = hosts.setdefault(entry["host"], {"requests": {}, "bytes": 0, "phases": {}})
+            status = str(entry["status"])
+            host["requests"][status] = host["requests"].get(status, 0) + 1
+            host["bytes"] += entry["bytes"]
+            for phase in ("dns", "connect", "ttfb", "download"):
+                host["phases"][phase] = host["phases"].get(phase, 0.0) + entry[f"{phase}_ms"] / 1000
+
+        lines = [
+            "# HELP daily_news_run_timestamp_seconds Start time of the last run.",
+            "# TYPE daily_news_run_timestamp_seconds gauge",
+            f"daily_news_run_timestamp_seconds {self.started_at:.3f}",
+            "# HELP daily_news_run_duration_seconds Wall-clock duration of the last run.",
+            "# TYPE daily_news_run_duration_seconds gauge",
+            f"daily_news_run_duration_seconds {report['duration_seconds']}",
+            "# HELP daily_news_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE daily_news_stage_seconds gauge",
+        ]
+        for name, seconds in sorted(report["stages"].items()):
+            stage, _, source = name.partition(".")
+            labels = f'stage="{stage}"' + (f',source="{source}"' if source else "")
+            lines.append(f"daily_news_stage_seconds{{{labels}}} {seconds}")
+        lines += [
+            "# HELP daily_news_http_requests Upstream HTTP requests by host and status.",
+            "# TYPE daily_news_http_requests gauge",
+        ]
+        for host, values in sorted(hosts.items()):
+            for status, count in sorted(values["requests"].items()):
+                lines.append(f'daily_news_http_requests{{host="{host}",status="{status}"}} {count}')
+        lines += [
+            "# HELP daily_news_http_received_bytes Bytes received from each host.",
+            "# TYPE daily_news_http_received_bytes gauge",
+        ]
+        for host, values in sorted(hosts.items()):
+            lines.append(f'daily_news_http_received_bytes{{host="{host}"}} {values["bytes"]}')
+        lines += [
+            "# HELP daily_news_http_phase_seconds Summed request time per phase (dns/connect/ttfb/download).",
+            "# TYPE daily_news_http_phase_seconds gauge",
+        ]
+        for host, values in sorted(hosts.items()):
+            for phase, seconds in values["phases"].items():
+                lines.append(f'daily_news_http_phase_seconds{{host="{host}",phase="{phase}"}} {seconds:.4f}')
+        lines += [
+            "# HELP daily_news_counter Run counters (items per source, image downloads, ...).",
+            "# TYPE daily_news_counter gauge",
+        ]
+        for name, value in sorted(report["counters"].items()):
+            lines.append(f'daily_news_counter{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, config: Dict) -> None:
+        """按配置写出JSON报告和Prometheus文件"""
+        if config.get("json_file"):
+            atomic_write(config["json_file"], json.dumps(self.to_report(), ensure_ascii=False, indent=2))
+        if config.get("prometheus_file"):
+            atomic_write(config["prometheus_file"], self.to_prometheus())
+
+_run_metrics = RunMetrics()
+# 当前线程的统计收集器 (常驻模式下每次获取各用一个, 互不混杂)
+_metrics_local = threading.local()
+
+def start_run_metrics() -> RunMetrics:
+    """开始一次新的运行统计"""
+    global _run_metrics
+    _run_metrics = RunMetrics()
+    return _run_metrics
+
+def get_run_metrics() -> RunMetrics:
+    """当前线程应记入的统计: use_run_metrics 指定的收集器, 否则为本次运行的统计"""
+    metrics = getattr(_metrics_local, "current", None)
+    return _run_metrics if metrics is None else metrics
+
+@contextmanager
+def use_run_metrics(metrics: RunMetrics):
+    """在 with 块内把当前线程的统计记入 metrics"""
+    previous = getattr(_metrics_local, "current", None)
+    _metrics_local.current = metrics
+    try:
+        yield metrics
+    finally:
+        _metrics_local.current = previous
+
+def _call_with_metrics(task: Callable[[], object]) -> Tuple[object, RunMetrics]:
+    """用新的统计收集器执行任务, 返回 (结果, 收集器)"""
+    with use_run_metrics(RunMetrics()) as metrics:
+        return task(), metrics
+
+# --- 运行截止时间 ---
+# 本次运行获取数据的截止时刻 (time.monotonic), 由 fetch_all_sources 设置, None 表示不限制。
+# 获取线程在截止后不再发起请求、不再等待重试, 使未完成的数据源尽快结束, 进程可以按时退出。
+_run_deadline = None
+
+def set_run_deadline(seconds: Optional[float]) -> None:
+    """从现在起 seconds 秒后截止, None 表示不限制"""
+    global _run_deadline
+    _run_deadline = time.monotonic() + seconds if seconds is not None else None
+
+def run_time_remaining() -> Optional[float]:
+    """距截止时间的剩余秒数 (已截止为 0), 不限制时返回 None"""
+    deadline = _run_deadline
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+# --- 请求阶段计时 ---
+# 当前线程正在进行的请求的计时信息, 由下面的连接类和 DNS 解析计时函数填写
+_request_timing = threading.local()
+_original_getaddrinfo = socket.getaddrinfo
+
+def _timed_getaddrinfo(*args, **kwargs):
+    timing = getattr(_request_timing, "current", None)
+    if timing is None:
+        return _original_getaddrinfo(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return _original_getaddrinfo(*args, **kwargs)
+    finally:
+        timing["dns_ms"] += (time.perf_counter() - start) * 1000
+
+class _TimedConnectMixin:
+    """记录新建连接的耗时 (包含DNS解析、TCP握手和TLS握手)"""
+
+    def connect(self):
+        timing = getattr(_request_timing, "current", None)
+        start = time.perf_counter()
+        super().connect()
+        if timing is not None:
+            timing["connect_total_ms"] += (time.perf_counter() - start) * 1000
+            timing["new_connections"] += 1
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """使用可计时连接的 HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool
+        }
+
+# =============== HTTP客户端 ===============
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """获取共享的HTTP会话 (按主机复用连接池, 保持 keep-alive)"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                http_config = CONFIG.get("http", {})
+                adapter_class = HTTPAdapter
+                if CONFIG.get("metrics", {}).get("enabled"):
+                    # 计时只在当前线程有请求计时信息时生效, 其他调用原样转发
+                    socket.getaddrinfo = _timed_getaddrinfo
+                    adapter_class = InstrumentedHTTPAdapter
+                adapter = adapter_class(
+                    pool_connections=http_config.get("pool_connections", 10),
+                    pool_maxsize=http_config.get("pool_maxsize", 16)
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "Accept-Encoding": "gzip, deflate, br" if BROTLI_AVAILABLE else "gzip, deflate",
+                    "Connection": "keep-alive"
+                })
+                _http_session = session
+    return _http_session
+
+def get_request_timeout(source: str = None) -> Tuple[float, float]:
+    """返回某个数据源的 (连接超时, 读取超时)"""
+    timeouts = CONFIG.get("timeouts", {})
+    overrides = timeouts.get("sources", {}).get(source, {}) if source else {}
+    return (overrides.get("connect", timeouts.get("connect", 5)),
+            overrides.get("read", timeouts.get("read", 15)))
+
+def rewrite_url(url: str) -> str:
+    """配置了 base_url 时, 把上游地址改写为 {base_url}/{scheme}/{host}/{path}"""
+    base_url = CONFIG.get("base_url")
+    if not base_url:
+        return url
+    parts = urlsplit(url)
+    rewritten = f"{base_url.rstrip('/')}/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+    return f"{rewritten}?{parts.query}" if parts.query else rewritten
+
+# =============== 重试与熔断 ===============
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """主机的熔断器处于打开状态, 请求被直接跳过"""
+
+class RunDeadlineExceeded(requests.exceptions.Timeout):
+    """已超过本次运行的截止时间, 请求被直接跳过"""
+
+class CircuitBreakers:
+    """按主机统计连续失败次数, 达到阈值后在冷却期内直接拒绝对该主机的请求
+
+    冷却期过后放行请求: 成功则恢复正常, 再次失败则立即重新熔断。状态保存到磁盘, 跨运行生效。
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float, state_file: str = None):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._hosts = {}
+        if state_file:
+            try:
+                with open(state_file, encoding="utf-8") as f:
+                    self._hosts = json.load(f)
+            except (OSError, ValueError):
+                self._hosts = {}
+
+    def _save(self) -> None:
+        if not self.state_file:
+            return
+        try:
+            atomic_write(self.state_file, json.dumps(self._hosts, ensure_ascii=False, indent=2))
+        except OSError as e:
+            print(f"保存熔断器状态失败: {e}")
+
+    def before_request(self, host: str) -> None:
+        """熔断中则抛出 CircuitOpenError"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state and state.get("open_until", 0) > time.time():
+                remaining = state["open_until"] - time.time()
+                raise CircuitOpenError(f"{host} 连续失败 {state['failures']} 次, 熔断中 (剩余 {remaining:.0f}s)")
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            if host in self._hosts:
+                del self._hosts[host]
+                self._save()
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            state = self._hosts.setdefault(host, {"failures": 0, "open_until": 0})
+            state["failures"] += 1
+            if state["failures"] >= self.failure_threshold:
+                state["open_until"] = time.time() + self.cooldown
+                print(f"⚠️ {host} 连续失败 {state['failures']} 次, 熔断 {self.cooldown}s")
+            self._save()
+
+_circuit_breakers = None
+_circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breakers() -> Optional[CircuitBreakers]:
+    """获取共享的熔断器 (配置中禁用时返回 None)"""
+    global _circuit_breakers
+    breaker_config = CONFIG.get("circuit_breaker", {})
+    if not breaker_config.get("enabled"):
+        return None
+    if _circuit_breakers is None:
+        with _circuit_breakers_lock:
+            if _circuit_breakers is None:
+                _circuit_breakers = CircuitBreakers(
+                    breaker_config.get("failure_threshold", 3),
+                    breaker_config.get("cooldown", 300),
+                    breaker_config.get("state_file")
+                )
+    return _circuit_breakers
+
+# =============== 按主机限流 ===============
+class HostLimit:
+    """单个主机的令牌桶与并发上限"""
+
+    def __init__(self, rate: Optional[float], burst: float, max_in_flight: int):
+        self.rate = rate
+        self.burst = max(1.0, burst or 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max(1, max_in_flight or 1))
+
+    def take_token(self) -> float:
+        """取走一个令牌 (不足时等待), 返回等待的秒数"""
+        if not self.rate:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    @contextmanager
+    def in_flight(self):
+        """占用一个并发名额直到退出"""
+        start = time.perf_counter()
+        with self._in_flight:
+            waited = time.perf_counter() - start
+            if waited > 0.001:
+                get_run_metrics().add_stage("rate_limit_wait", waited)
+            yield
+
+class HostRateLimiter:
+    """按主机 (URL 的 netloc) 分配 HostLimit, 未单独配置的主机使用默认值"""
+
+    def __init__(self, limits_config: Dict):
+        self.default = limits_config.get("default", {})
+        self.hosts_config = limits_config.get("hosts", {})
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> HostLimit:
+        limit = self._limits.get(host)
+        if limit is None:
+            with self._lock:
+                limit = self._limits.get(host)
+                if limit is None:
+                    options = {**self.default, **self.hosts_config.get(host, {})}
+                    limit = HostLimit(options.get("rate"), options.get("burst", 1), options.get("max_in_flight", 8))
+                    self._limits[host] = limit
+        return limit
+
+    def acquire_token(self, url: str) -> None:
+        waited = self.get(urlsplit(url).netloc).take_token()
+        if waited:
+            get_run_metrics().add_stage("rate_limit_wait", waited)
+
+    def in_flight(self, url: str):
+        return self.get(urlsplit(url).netloc).in_flight()
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> HostRateLimiter:
+    """获取共享的按主机限流器"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = HostRateLimiter(CONFIG.get("rate_limits", {}))
+    return _rate_limiter
+
+def _backoff_delay(attempt: int, retry_config: Dict) -> float:
+    """指数退避加全抖动: 在 [0, min(上限, 基数 * 2^(attempt-1))] 中随机取值"""
+    ceiling = min(retry_config.get("backoff_max", 8), retry_config.get("backoff_base", 0.5) * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """解析 Retry-After 响应头 (秒数或HTTP日期)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _retry_past_deadline(delay: float) -> bool:
+    """等待 delay 秒后重试是否会超过运行截止时间"""
+    remaining = run_time_remaining()
+    return remaining is not None and delay >= remaining
+
+def _send_get(url: str, headers: Dict = None, **kwargs) -> requests.Response:
+    """发送请求: 可重试的错误按退避策略重试, 并更新目标主机的熔断器"""
+    kwargs.setdefault("timeout", get_request_timeout())  # 不允许无超时的请求
+    host = urlsplit(url).netloc
+    breakers = get_circuit_breakers()
+    if breakers is not None:
+        breakers.before_request(host)
+
+    retry_config = CONFIG.get("retry", {})
+    attempts = max(1, retry_config.get("max_attempts", 1))
+    retry_statuses = set(retry_config.get("statuses", []))
+    limiter = get_rate_limiter()
+    timeout = kwargs["timeout"]
+    for attempt in range(1, attempts + 1):
+        remaining = run_time_remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise RunDeadlineExceeded(f"超过运行截止时间, 跳过请求 {url}")
+            # 单个请求的超时不超过运行的剩余时间
+            kwargs["timeout"] = (tuple(min(t, remaining) for t in timeout) if isinstance(timeout, tuple)
+                                 else min(timeout, remaining))
+        limiter.acquire_token(url)  # 每次尝试 (包括重试) 都消耗令牌
+        try:
+            if kwargs.get("stream"):
+                # 流式响应的正文在返回后才读取, 并发名额由调用方 (如 _stream_to_temp) 占用
+                response = get_http_session().get(rewrite_url(url), headers=headers, **kwargs)
+            else:
+                with limiter.in_flight(url):
+                    response = get_http_session().get(rewrite_url(url), headers=headers, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == attempts:
+                if breakers is not None:
+                    breakers.record_failure(host)
+                raise
+            delay = _backoff_delay(attempt, retry_config)
+            if _retry_past_deadline(delay):
+                raise
+            reason = type(e).__name__
+        else:
+            if response.status_code not in retry_statuses:
+                if breakers is not None:
+                    breakers.record_success(host)
+                return response
+            delay = _retry_after(response) if response.status_code == 429 else None
+            if delay is None:
+                delay = _backoff_delay(attempt, retry_config)
+            if attempt == attempts or delay > retry_config.get("backoff_max", 8):
+                if breakers is not None:
+                    breakers.record_failure(host)
+                return response
+            if _retry_past_deadline(delay):
+                return response
+            response.close()
+            reason = f"HTTP {response.status_code}"
+        print(f"请求失败 ({reason}) {url}, {delay:.1f}s 后重试 ({attempt}/{attempts - 1})")
+        get_run_metrics().incr("http_retries")
+        time.sleep(delay)
+
+def _conditional_get(url: str, headers: Dict, use_cache: bool, **kwargs) -> requests.Response:
+    cache = get_http_cache() if use_cache else None
+    if cache is None:
+        return _send_get(url, headers=headers, **kwargs)
+
+    request_headers = dict(headers or {})
+    request_headers.update(cache.conditional_headers(url))
+    response = _send_get(url, headers=request_headers, **kwargs)
+    if response.status_code == 304:
+        cached = cache.replay(url, response)
+        if cached is not None:
+            cached.from_cache = True
+            cached.cache_url = url
+            return cached
+        # 缓存文件已丢失, 去掉条件头重新请求
+        response = _send_get(url, headers=headers, **kwargs)
+    response.from_cache = False
+    if response.status_code == 200 and cache.store(url, response):
+        response.cache_url = url
+    return response
+
+def _instrumented_get(url: str, headers: Dict, use_cache: bool, **kwargs) -> requests.Response:
+    """发送请求并把 DNS/连接/首字节/下载耗时记入本次运行的指标"""
+    timing = {"dns_ms": 0.0, "connect_total_ms": 0.0, "new_connections": 0}
+    _request_timing.current = timing
+    start = time.perf_counter()
+    try:
+        response = _conditional_get(url, headers, use_cache, **kwargs)
+    finally:
+        _request_timing.current = None
+    total_ms = (time.perf_counter() - start) * 1000
+    from_cache = getattr(response, "from_cache", False)
+    streamed = kwargs.get("stream", False)
+    # elapsed 为发出请求到解析完响应头的时间; 流式响应的正文由调用方之后读取, 这里不计入
+    headers_ms = total_ms if from_cache else min(response.elapsed.total_seconds() * 1000, total_ms)
+    connect_ms = max(timing["connect_total_ms"] - timing["dns_ms"], 0.0)
+    get_run_metrics().record_request({
+        "url": url,
+        "host": urlsplit(url).netloc,
+        "status": 304 if from_cache else response.status_code,
+        "bytes": 0 if (from_cache or streamed) else len(response.content),
+        "new_connections": timing["new_connections"],
+        "dns_ms": round(timing["dns_ms"], 3),
+        "connect_ms": round(connect_ms, 3),
+        "ttfb_ms": round(max(headers_ms - timing["connect_total_ms"], 0.0), 3),
+        "download_ms": round(0.0 if streamed else max(total_ms - headers_ms, 0.0), 3),
+        "total_ms": round(total_ms, 3)
+    })
+    return response
+
+def http_get(url: str, headers: Dict = None, use_cache: bool = False, **kwargs) -> requests.Response:
+    """通过共享会话发送 GET 请求
+
+    use_cache=True 时发送条件请求, 304 时返回磁盘缓存的响应; 录制模式下保存收到的每个响应。
+    """
+    if not CONFIG.get("metrics", {}).get("enabled"):
+        response = _conditional_get(url, headers, use_cache, **kwargs)
+    else:
+        response = _instrumented_get(url, headers, use_cache, **kwargs)
+    recorder = get_response_recorder()
+    if recorder is not None:
+        # 录制模式下读取完整正文 (流式下载随后从内存中分块读取)
+        recorder.save(url, response.status_code, dict(response.headers), response.content)
+    return response
+
+# =============== HTTP条件请求缓存 ===============
+_MISSING = object()
+
+@contextmanager
+def atomic_open(path: str, mode: str = "wb"):
+    """打开同目录的临时文件供 (流式) 写入, 正常结束后重命名为 path, 出错时删除临时文件"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as f:
+            yield f
+        # mkstemp 创建的文件权限是 0600, 改为与原文件一致 (新文件用 0644), 否则Web服务器可能无法读取
+        try:
+            permissions = os.stat(path).st_mode & 0o777
+        except OSError:
+            permissions = 0o644
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write(path: str, content) -> None:
+    """先写入同目录的临时文件再重命名, 避免读者看到写了一半的文件"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    with atomic_open(path) as f:
+        f.write(content)
+
+class HttpCache:
+    """基于 ETag / Last-Modified 的磁盘HTTP缓存, 同时保存每个响应对应的解析结果"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, suffix: str) -> str:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def load(self, url: str) -> Optional[Dict]:
+        """读取缓存条目的元数据 (不存在时返回 None)"""
+        try:
+            with open(self._path(url, ".json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """生成 If-None-Match / If-Modified-Since 请求头"""
+        meta = self.load(url)
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def store(self, url: str, response: requests.Response) -> bool:
+        """保存带校验信息的响应, 没有 ETag / Last-Modified 的响应不缓存"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return False
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": response.headers.get("Content-Type", ""),
+            "encoding": response.encoding,
+            "stored_at": time.time()
+        }
+        with self._lock:
+            # 先写正文再写元数据, 元数据存在即说明正文完整
+            atomic_write(self._path(url, ".body"), response.content)
+            atomic_write(self._path(url, ".json"), json.dumps(meta, ensure_ascii=False))
+            parsed_path = self._path(url, ".parsed")
+            if os.path.exists(parsed_path):
+                os.remove(parsed_path)
+        return True
+
+    def replay(self, url: str, not_modified: requests.Response) -> Optional[requests.Response]:
+        """收到 304 时用缓存的正文构造一个 200 响应"""
+        meta = self.load(url)
+        if not meta:
+            return None
+        try:
+            with open(self._path(url, ".body"), "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response.headers = CaseInsensitiveDict({"Content-Type": meta.get("content_type", "")})
+        response.encoding = meta.get("encoding")
+        response.request = not_modified.request
+        response._content = body
+        return response
+
+    def load_parsed(self, url: str, parse_key: str):
+        """读取缓存的解析结果, 没有时返回 _MISSING"""
+        try:
+            with open(self._path(url, ".parsed"), "rb") as f:
+                return pickle.load(f).get(parse_key, _MISSING)
+        except Exception:
+            return _MISSING
+
+    def store_parsed(self, url: str, parse_key: str, value) -> None:
+        """保存某个响应的解析结果 (同一响应可按不同参数保存多份)"""
+        path = self._path(url, ".parsed")
+        with self._lock:
+            try:
+                with open(path, "rb") as f:
+                    parsed = pickle.load(f)
+            except Exception:
+                parsed = {}
+            parsed[parse_key] = value
+            try:
+                atomic_write(path, pickle.dumps(parsed))
+            except (OSError, pickle.PicklingError) as e:
+                print(f"保存解析缓存失败 {url}: {e}")
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+def get_http_cache() -> Optional[HttpCache]:
+    """获取共享的HTTP缓存 (配置中禁用时返回 None)"""
+    global _http_cache
+    cache_config = CONFIG.get("http_cache", {})
+    if not cache_config.get("enabled"):
+        return None
+    if _http_cache is None:
+        with _http_cache_lock:
+            if _http_cache is None:
+                _http_cache = HttpCache(cache_config.get("dir", os.path.join(".cache", "http")))
+    return _http_cache
+
+def parse_response(response: requests.Response, parse_key: str, parser: Callable):
+    """解析响应; 响应未变化 (304) 且已有解析结果时直接复用, 跳过解析"""
+    cache = get_http_cache()
+    url = getattr(response, "cache_url", None)
+    if cache is None or url is None:
+        return _timed_parse(parse_key, parser, response)
+    if getattr(response, "from_cache", False):
+        cached = cache.load_parsed(url, parse_key)
+        if cached is not _MISSING:
+            get_run_metrics().incr("parse_cache_hits")
+            return cached
+    result = _timed_parse(parse_key, parser, response)
+    cache.store_parsed(url, parse_key, result)
+    return result
+
+def _timed_parse(parse_key: str, parser: Callable, response: requests.Response):
+    with get_run_metrics().stage("parse." + parse_key.split(":")[0]):
+        return parser(response)
+
+# =============== 响应录制与回放 ===============
+class ResponseStore:
+    """按URL保存上游响应 (元数据JSON + 正文文件), 供离线基准测试和回放使用"""
+
+    # 正文保存的是解压后的内容, 这些与传输相关的响应头不再适用
+    SKIP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, suffix: str) -> str:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def save(self, url: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        meta = {
+            "url": url,
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k.lower() not in self.SKIP_HEADERS}
+        }
+        atomic_write(self._path(url, ".body"), body)
+        atomic_write(self._path(url, ".json"), json.dumps(meta, ensure_ascii=False, indent=2))
+
+    def load(self, url: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """读取录制的响应, 返回 (状态码, 响应头, 正文), 没有录制时返回 None"""
+        try:
+            with open(self._path(url, ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._path(url, ".body"), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta["status"], meta.get("headers", {}), body
+
+class ReplayAdapter(BaseAdapter):
+    """requests 传输适配器: 不访问网络, 直接返回 ResponseStore 中录制的响应 (未录制的URL返回404)"""
+
+    def __init__(self, store: ResponseStore):
+        super().__init__()
+        self.store = store
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        recorded = self.store.load(request.url)
+        status, headers, body = recorded if recorded is not None else (404, {}, b"")
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status == 200 else ""
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response._content = body
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+_response_recorder = None
+_response_recorder_lock = threading.Lock()
+
+def get_response_recorder() -> Optional[ResponseStore]:
+    """获取录制上游响应的存储 (未配置 record_dir 时返回 None)"""
+    global _response_recorder
+    record_dir = CONFIG.get("record_dir")
+    if not record_dir:
+        return None
+    if _response_recorder is None or _response_recorder.directory != record_dir:
+        with _response_recorder_lock:
+            if _response_recorder is None or _response_recorder.directory != record_dir:
+                _response_recorder = ResponseStore(record_dir)
+    return _response_recorder
+
+def install_replay_adapter(directory: str) -> ResponseStore:
+    """让共享HTTP会话的所有请求都从录制目录回放"""
+    store = ResponseStore(directory)
+    adapter = ReplayAdapter(store)
+    session = get_http_session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return store
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """回放服务器的请求处理: 路径格式为 /{scheme}/{host}/{path}, 与 rewrite_url 对应"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        options = self.server.options
+        delay = options.get("latency_ms", 0) + random.uniform(-1, 1) * options.get("jitter_ms", 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if random.random() < options.get("error_rate", 0.0):
+            self._reply(options.get("error_status", 503), {"Content-Type": "text/plain"}, b"injected error")
+            return
+        parts = self.path.lstrip("/").split("/", 2)
+        recorded = None
+        if len(parts) >= 2:
+            url = f"{parts[0]}://{parts[1]}/{parts[2] if len(parts) > 2 else ''}"
+            recorded = self.server.store.load(url)
+        if recorded is None:
+            self._reply(404, {"Content-Type": "text/plain"}, b"not recorded")
+            return
+        self._reply(*recorded)
+
+    def _reply(self, status: int, headers: Dict[str, str], body: bytes) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.options.get("verbose"):
+            super().log_message(format, *args)
+
+def start_replay_server(directory: str, options: Dict) -> ThreadingHTTPServer:
+    """在后台线程启动回放服务器, 返回服务器对象 (调用 shutdown() 停止)"""
+    server = ThreadingHTTPServer((options.get("host", "127.0.0.1"), options.get("port", 8800)), ReplayRequestHandler)
+    server.daemon_threads = True
+    server.store = ResponseStore(directory)
+    server.options = options
+    threading.Thread(target=server.serve_forever, name="replay-server", daemon=True).start()
+    return server
+
+# =============== 内嵌JSON提取 ===============
+_JSON_DECODER = json.JSONDecoder()
+
+_ASSIGNMENT = re.compile(r"\s*=\s*")
+_WHITESPACE = re.compile(r"\s*")
+
+def extract_embedded_json(text: str, marker: str, in_tag: bool = False, lookahead: int = 256,
+                          max_matches: int = 5):
+    """提取页面中 marker 之后内嵌的 JSON 对象, 返回 dict, 找不到时返回 None
+
+    默认 marker 是赋值目标 (如 window.__INITIAL_STATE__ = {...}): 其后只允许空白和一个 "=", 然后必须是 "{"。
+    in_tag=True 时 marker 是标签中的属性 (如 <script id="js-initialData" ...>{...}): 跳过同一标签中
+    lookahead 个字符内剩余的属性直到 ">", 之后只允许空白再接 "{"。
+    对象用 raw_decode 从 "{" 处恰好解码一个, 整体是线性时间, 不会截断在字符串里的 "}" 上。
+    最多尝试 max_matches 处 marker。
+    """
+    start = 0
+    for _ in range(max_matches):
+        index = text.find(marker, start)
+        if index < 0:
+            return None
+        start = index + len(marker)
+        if in_tag:
+            tag_end = text.find(">", start, start + lookahead)
+            if tag_end < 0 or "<" in text[start:tag_end]:
+                continue
+            brace = _WHITESPACE.match(text, tag_end + 1).end()
+        else:
+            assignment = _ASSIGNMENT.match(text, start)
+            if assignment is None:
+                continue
+            brace = assignment.end()
+        if not text.startswith("{", brace):
+            continue
+        try:
+            value, _ = _JSON_DECODER.raw_decode(text, brace)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
 # =============== 数据获取函数 ===============
 # (数据获取函数保持不变 - 来源于你提供的文件)
+def get_parser_backend() -> str:
+    """根据配置和已安装的库选择HTML解析后端"""
+    choice = CONFIG.get("parser", "auto")
+    if choice == "selectolax" and SelectolaxParser is not None:
+        return "selectolax"
+    if choice == "lxml" and LXML_AVAILABLE:
+        return "lxml"
+    if choice == "auto":
+        if SelectolaxParser is not None:
+            return "selectolax"
+        if LXML_AVAILABLE:
+            return "lxml"
+    return "html.parser"
+
+def _build_github_project(name: str, href: str, description: Optional[str], language: Optional[str],
+                          counters: List[str]) -> GithubProject:
+    """由解析出的文本构建 GithubProject"""
+    return GithubProject(
+        name=name.strip().replace("\n", "").replace(" ", ""),
+        url="https://github.com" + href,
+        description=description.strip() if description is not None else "No description",
+        language=language.strip() if language is not None else "Unknown",
+        stars=int(counters[0].strip().replace(",", "")),
+        forks=int(counters[1].strip().replace(",", ""))
+    )
+
+def _has_box_row_class(value: Optional[str]) -> bool:
+    # class 可能是 "Box-row" 也可能是 "Box-row xxx", 不同 bs4 版本传入的值不同
+    return value is not None and "Box-row" in value.split()
+
+def parse_github_trending(html: str, limit: int) -> List[GithubProject]:
+    """解析GitHub Trending页面"""
+    projects = []
+    if get_parser_backend() == "selectolax":
+        for repo in SelectolaxParser(html).css("article.Box-row")[:limit]:
+            # 解析项目信息
+            name_elem = repo.css_first("h2 a")
+            desc_elem = repo.css_first("p")
+            lang_elem = repo.css_first("span[itemprop='programmingLanguage']")
+            projects.append(_build_github_project(
+                name_elem.text(), name_elem.attributes.get("href", ""),
+                desc_elem.text() if desc_elem else None,
+                lang_elem.text() if lang_elem else None,
+                [elem.text() for elem in repo.css("a.Link--muted")]
+            ))
+        return projects
+
+    # BeautifulSoup 只构建 article.Box-row 部分的文档树
+    soup = BeautifulSoup(html, get_parser_backend(), parse_only=SoupStrainer("article", class_=_has_box_row_class))
+    for repo in soup.select("article.Box-row")[:limit]:
+        # 解析项目信息
+        name_elem = repo.select_one("h2 a")
+        desc_elem = repo.select_one("p")
+        lang_elem = repo.select_one("span[itemprop='programmingLanguage']")
+        projects.append(_build_github_project(
+            name_elem.text, name_elem["href"],
+            desc_elem.text if desc_elem else None,
+            lang_elem.text if lang_elem else None,
+            [elem.text for elem in repo.select("a.Link--muted")]
+        ))
+    return projects
+
 def fetch_github_trending(limit: int = 10, chinese_only: bool = False) -> List[GithubProject]:
     """获取GitHub热门项目"""
     if chinese_only:
@@ -124,31 +1303,41 @@ def fetch_github_trending(limit: int = 10, chinese_only: bool = False) -> List[G
         url = "https://github.com/trending?since=daily"
     try:
         headers = {"User-Agent": get_random_user_agent()}  # 修改为随机User-Agent
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers, use_cache=True,
+                            timeout=get_request_timeout("github"))
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        projects = []
-        for repo in soup.select("article.Box-row")[:limit]:
-            # 解析项目信息
-            name_elem = repo.select_one("h2 a")
-            name = name_elem.text.strip().replace("\n", "").replace(" ", "")
-            url = "https://github.com" + name_elem["href"]
-            desc_elem = repo.select_one("p")
-            description = desc_elem.text.strip() if desc_elem else "No description"
-            lang_elem = repo.select_one("span[itemprop='programmingLanguage']")
-            language = lang_elem.text.strip() if lang_elem else "Unknown"
-            stars_elem = repo.select("a.Link--muted")[0]
-            stars = int(stars_elem.text.strip().replace(",", ""))
-            forks_elem = repo.select("a.Link--muted")[1]
-            forks = int(forks_elem.text.strip().replace(",", ""))
-            projects.append(GithubProject(
-                name=name, url=url, description=description,
-                language=language, stars=stars, forks=forks
-            ))
-        return projects
+        return parse_response(response, f"github:{limit}",
+                              lambda r: parse_github_trending(r.text, limit))
     except Exception as e:
         print(f"获取GitHub热门项目失败: {e}")
         return []
+
+def parse_bilibili_hot(data: Dict, limit: int) -> List[BilibiliVideo]:
+    """解析B站热门/分区排行接口返回的数据"""
+    videos = []
+    video_list = data.get("data", {}).get("list", [])
+    if not video_list:
+        video_list = data.get("data", [])
+    for item in video_list[:limit]:
+        owner = item.get("owner", {})
+        stat = item.get("stat", {})
+        # 获取发布时间并格式化
+        pub_timestamp = item.get("pubdate", 0)
+        published_date = datetime.fromtimestamp(pub_timestamp).strftime("%Y-%m-%d")
+        video = BilibiliVideo(
+            title=item.get("title", "无标题"),
+            url=f"https://www.bilibili.com/video/{item.get('bvid', '')}" if item.get('bvid') else item.get("short_link_v2", "#"),
+            cover=item.get("pic", "").replace("http://", "https://"),
+            up_name=owner.get("name", "未知UP主"),
+            up_url=f"https://space.bilibili.com/{owner.get('mid', '')}" if owner.get('mid') else "#",
+            duration=format_duration(item.get("duration", 0)),
+            views=format_number(stat.get("view", 0)),
+            danmaku=format_number(stat.get("danmaku", 0)),
+            published_date=published_date  # 存储格式化后的时间
+        )
+        videos.append(video)
+    return videos
+
 def fetch_bilibili_hot(limit: int = 10, region: str = "all") -> List[BilibiliVideo]:
     """获取B站热门视频"""
     url = "https://api.bilibili.com/x/web-interface/popular"
@@ -156,36 +1345,50 @@ def fetch_bilibili_hot(limit: int = 10, region: str = "all") -> List[BilibiliVid
         url = f"https://api.bilibili.com/x/web-interface/ranking/region?rid={region}"
     try:
         headers = {"User-Agent": get_random_user_agent()}  # 修改为随机User-Agent
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers, use_cache=True,
+                            timeout=get_request_timeout("bilibili"))
         response.raise_for_status()
-        data = response.json()
-        videos = []
-        video_list = data.get("data", {}).get("list", [])
-        if not video_list:
-            video_list = data.get("data", [])
-        for item in video_list[:limit]:
-            owner = item.get("owner", {})
-            stat = item.get("stat", {})
-            # 获取发布时间并格式化
-            pub_timestamp = item.get("pubdate", 0)
-            published_date = datetime.fromtimestamp(pub_timestamp).strftime("%Y-%m-%d")
-            video = BilibiliVideo(
-                title=item.get("title", "无标题"),
-                url=f"https://www.bilibili.com/video/{item.get('bvid', '')}" if item.get('bvid') else item.get("short_link_v2", "#"),
-                cover=item.get("pic", "").replace("http://", "https://"),
-                up_name=owner.get("name", "未知UP主"),
-                up_url=f"https://space.bilibili.com/{owner.get('mid', '')}" if owner.get('mid') else "#",
-                duration=format_duration(item.get("duration", 0)),
-                views=format_number(stat.get("view", 0)),
-                danmaku=format_number(stat.get("danmaku", 0)),
-                published_date=published_date  # 存储格式化后的时间
-            )
-            videos.append(video)
-        return videos
+        return parse_response(response, f"bilibili:{limit}",
+                              lambda r: parse_bilibili_hot(r.json(), limit))
     except Exception as e:
         print(f"获取B站热门视频失败: {e}")
         return []
 
+def parse_weibo_hot(data: Dict, limit: int) -> List[WeiboHot]:
+    """解析微博热搜接口返回的数据"""
+    hot_list = []
+    # 实时热搜
+    realtime_data = data.get("data", {}).get("realtime", [])
+    for idx, item in enumerate(realtime_data[:limit], 1):
+        # 处理热度值
+        hot_score = item.get("raw_hot", "") # 优先用 raw_hot
+        if not hot_score:
+            hot_score = item.get("num", "") # 备选 num
+        if isinstance(hot_score, int):
+            hot_score = format_number(hot_score)
+        elif isinstance(hot_score, str) and '万' in hot_score: # 如果已经是带万的字符串
+            pass # 保持原样
+        elif isinstance(hot_score, str): # 尝试转换纯数字字符串
+            try: hot_score = format_number(int(hot_score))
+            except: pass # 无法转换则保持原样
+        # 处理标签
+        label = item.get("label_name", "") # 使用 label_name
+        # label_map 在 HTML 生成部分处理
+        word = item.get("word", "无标题") # 使用 word
+        # 优化 URL 获取逻辑
+        search_url = item.get("scheme", "") # 优先使用 scheme (通常是 m.weibo.cn 链接)
+        if not search_url:
+            encoded_word = requests.utils.quote(word)
+            search_url = f"https://s.weibo.com/weibo?q=%23{encoded_word}%23" # 备选话题链接
+        hot_list.append(WeiboHot(
+            title=word,
+            url=search_url,
+            rank=idx, # rank 仍然获取，但在 HTML 中不显示
+            hot_score=hot_score or "N/A",
+            label=label
+        ))
+    return hot_list[:limit]
+
 def fetch_weibo_hot(limit: int = 10, category: str = "realtime") -> List[WeiboHot]:
     """获取微博热搜"""
     url = "https://weibo.com/ajax/side/hotSearch"
@@ -194,104 +1397,118 @@ def fetch_weibo_hot(limit: int = 10, category: str = "realtime") -> List[WeiboHo
             "User-Agent": get_random_user_agent(),  # 修改为随机User-Agent
             # "Cookie": "YOUR_WEIBO_COOKIE" # 如果需要登录信息
         }
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers, use_cache=True,
+                            timeout=get_request_timeout("weibo"))
         response.raise_for_status()
-        data = response.json()
-        hot_list = []
-        # 实时热搜
-        realtime_data = data.get("data", {}).get("realtime", [])
-        for idx, item in enumerate(realtime_data[:limit], 1):
-            # 处理热度值
-            hot_score = item.get("raw_hot", "") # 优先用 raw_hot
-            if not hot_score:
-                hot_score = item.get("num", "") # 备选 num
-            if isinstance(hot_score, int):
-                hot_score = format_number(hot_score)
-            elif isinstance(hot_score, str) and '万' in hot_score: # 如果已经是带万的字符串
-                pass # 保持原样
-            elif isinstance(hot_score, str): # 尝试转换纯数字字符串
-                try: hot_score = format_number(int(hot_score))
-                except: pass # 无法转换则保持原样
-            # 处理标签
-            label = item.get("label_name", "") # 使用 label_name
-            # label_map 在 HTML 生成部分处理
-            word = item.get("word", "无标题") # 使用 word
-            # 优化 URL 获取逻辑
-            search_url = item.get("scheme", "") # 优先使用 scheme (通常是 m.weibo.cn 链接)
-            if not search_url:
-                encoded_word = requests.utils.quote(word)
-                search_url = f"https://s.weibo.com/weibo?q=%23{encoded_word}%23" # 备选话题链接
-            hot_list.append(WeiboHot(
-                title=word,
-                url=search_url,
-                rank=idx, # rank 仍然获取，但在 HTML 中不显示
-                hot_score=hot_score or "N/A",
-                label=label
-            ))
-        return hot_list[:limit]
+        return parse_response(response, f"weibo:{limit}",
+                              lambda r: parse_weibo_hot(r.json(), limit))
     except Exception as e:
         print(f"获取微博热搜失败: {e}")
         return []
 
+def parse_zhihu_api(data: Dict, limit: int) -> List[ZhihuQuestion]:
+    """解析知乎热榜 API 返回的数据"""
+    questions = []
+    for item in data.get("data", [])[:limit]:
+        target = item.get("target", {})
+        question_id = target.get('id')
+        question_url = f"https://www.zhihu.com/question/{question_id}" if question_id else "#"
+        hot_score_text = item.get("detail_text", "") # 获取热度文本
+        hot_score = hot_score_text.replace(" 热度", "").strip() # 清理
+        questions.append(ZhihuQuestion(
+            title=target.get("title", "无标题"),
+            url=question_url,
+            hot_score=hot_score or "N/A", # 处理空值
+            answer_count=target.get("answer_count", 0),
+            follower_count=target.get("follower_count", 0)
+        ))
+    return questions
+
+def _find_zhihu_initial_data_script(html: str) -> Optional[str]:
+    """用HTML解析器查找 script#js-initialData 的内容"""
+    if get_parser_backend() == "selectolax":
+        script_node = SelectolaxParser(html).css_first("script#js-initialData")
+        return script_node.text() if script_node else None
+    # 只解析目标 script 标签, 不构建整个文档树
+    soup = BeautifulSoup(html, get_parser_backend(), parse_only=SoupStrainer("script", id="js-initialData"))
+    script_tag = soup.find('script', id='js-initialData')
+    return script_tag.string if script_tag else None
+
+def parse_zhihu_billboard(html: str, limit: int) -> List[ZhihuQuestion]:
+    """解析知乎热榜网页中的 js-initialData"""
+    questions = []
+    # 优先直接定位内嵌JSON, 找不到时 (例如属性写法不同) 再用解析器查找 script 标签
+    json_data = extract_embedded_json(html, 'id="js-initialData"', in_tag=True)
+    if json_data is None:
+        script_text = _find_zhihu_initial_data_script(html)
+        if script_text:
+            json_data = json.loads(script_text)
+    if json_data:
+        hot_list = json_data.get("initialState", {}).get("topstory", {}).get("hotList", [])
+        for item in hot_list[:limit]:
+            card_id = item.get("cardId", "")
+            question_id_match = re.search(r'Question-(\d+)', card_id)
+            if question_id_match:
+                question_id = question_id_match.group(1)
+                target = item.get("target", {})
+                metrics_text = target.get("metricsArea", {}).get("text", "N/A").replace(" 热度", "").strip()
+                questions.append(ZhihuQuestion(
+                    title=target.get("titleArea", {}).get("text", "无标题"),
+                    url=f"https://www.zhihu.com/question/{question_id}",
+                    hot_score=metrics_text,
+                    answer_count=0,
+                    follower_count=0
+                ))
+    return questions
+
 def fetch_zhihu_hot(limit: int = 10, category: str = "hot") -> List[ZhihuQuestion]:
     """获取知乎热榜"""
     url = "https://www.zhihu.com/api/v3/feed/topstory/hot-lists/total?limit=50"
     headers = {"User-Agent": get_random_user_agent()}  # 修改为随机User-Agent
     try:
         questions = []
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers, use_cache=True,
+                            timeout=get_request_timeout("zhihu"))
         if response.status_code == 200:
-            response.raise_for_status()
-            data = response.json()
-            for item in data.get("data", [])[:limit]:
-                target = item.get("target", {})
-                question_id = target.get('id')
-                question_url = f"https://www.zhihu.com/question/{question_id}" if question_id else "#"
-                hot_score_text = item.get("detail_text", "") # 获取热度文本
-                hot_score = hot_score_text.replace(" 热度", "").strip() # 清理
-                questions.append(ZhihuQuestion(
-                    title=target.get("title", "无标题"),
-                    url=question_url,
-                    hot_score=hot_score or "N/A", # 处理空值
-                    answer_count=target.get("answer_count", 0),
-                    follower_count=target.get("follower_count", 0)
-                ))
+            questions = parse_response(response, f"zhihu:{limit}",
+                                       lambda r: parse_zhihu_api(r.json(), limit))
         # 添加了网页解析的备选方案 (来自上一版，但保留以防 API 失效)
         if not questions:
             print("API获取知乎热榜失败，尝试解析网页...")
             web_url = "https://www.zhihu.com/billboard"
-            web_response = requests.get(web_url, headers=headers)
+            web_response = http_get(web_url, headers=headers, use_cache=True,
+                                timeout=get_request_timeout("zhihu"))
             web_response.raise_for_status()
-            soup = BeautifulSoup(web_response.text, 'html.parser')
-            script_tag = soup.find('script', id='js-initialData')
-            if script_tag:
-                json_data = json.loads(script_tag.string)
-                hot_list = json_data.get("initialState", {}).get("topstory", {}).get("hotList", [])
-                for item in hot_list[:limit]:
-                    card_id = item.get("cardId", "")
-                    question_id_match = re.search(r'Question-(\d+)', card_id)
-                    if question_id_match:
-                        question_id = question_id_match.group(1)
-                        target = item.get("target", {})
-                        metrics_text = target.get("metricsArea", {}).get("text", "N/A").replace(" 热度", "").strip()
-                        questions.append(ZhihuQuestion(
-                            title=target.get("titleArea", {}).get("text", "无标题"),
-                            url=f"https://www.zhihu.com/question/{question_id}",
-                            hot_score=metrics_text,
-                            answer_count=0,
-                            follower_count=0
-                        ))
+            questions = parse_response(web_response, f"zhihu:{limit}",
+                                       lambda r: parse_zhihu_billboard(r.text, limit))
         return questions[:limit]
     except Exception as e:
         print(f"获取知乎热榜失败: {e}")
         return []
 
+def parse_pixiv_ranking_page(html: str, limit: int):
+    """解析Pixiv排行榜网页中的 JSON 数据, 未找到时返回 None"""
+    data = extract_embedded_json(html, "window.__INITIAL_STATE__")
+    if data is None:
+        return None
+    # 提取插画信息，需要适配可能的层级结构
+    # (根据实际观察到的结构调整路径)
+    illust_items = data.get("ranking", {}).get("ranking", []) # 尝试路径 1
+    if not illust_items:
+        illust_items = data.get("illusts", []) # 尝试路径 2
+    illusts = []
+    for item in illust_items[:limit]:
+        # 提取需要的信息
+        illust_id = item.get("illustId")
+        if illust_id:
+            illusts.append(item) # 如果结构匹配，添加到列表中
+    return illusts
+
 def fetch_pixiv_ranking(limit: int = 10, mode: str = "daily") -> List[PixivArtwork]:
     """获取Pixiv排行榜 (包含本地缓存)"""
     date_str = datetime.now().strftime("%Y-%m-%d")
-    image_dir = os.path.join("images", date_str)
+    image_dir = os.path.join(image_root(CONFIG), date_str)
     try:
-        os.makedirs(image_dir, exist_ok=True)
         url = f"https://www.pixiv.net/ranking.php?mode={mode}"
         headers = {
             "User-Agent": get_random_user_agent(),  # 修改为随机User-Agent
@@ -299,72 +1516,421 @@ def fetch_pixiv_ranking(limit: int = 10, mode: str = "daily") -> List[PixivArtwo
         }
         # 优先尝试解析网页中的 JSON 数据
         print(f"尝试解析 Pixiv 网页: {url}")
-        response = requests.get(url, headers=headers)
+        response = http_get(url, headers=headers, use_cache=True,
+                            timeout=get_request_timeout("pixiv"))
         response.raise_for_status()
-        pattern = re.compile(r'window.__INITIAL_STATE__\s*=\s*({.*?})\s*;?\s*</script>', re.DOTALL)
-        match = pattern.search(response.text)
-        illusts = []
-        if match:
+        illusts = parse_response(response, f"pixiv:{limit}",
+                                 lambda r: parse_pixiv_ranking_page(r.text, limit))
+        if illusts is not None:
             print("成功匹配到网页内 JSON 数据。")
-            data = json.loads(match.group(1))
-            # 提取插画信息，需要适配可能的层级结构
-            # (根据实际观察到的结构调整路径)
-            illust_items = data.get("ranking", {}).get("ranking", []) # 尝试路径 1
-            if not illust_items:
-                illust_items = data.get("illusts", []) # 尝试路径 2
-            for item in illust_items[:limit]:
-                # 提取需要的信息
-                illust_id = item.get("illustId")
-                if illust_id:
-                    illusts.append(item) # 如果结构匹配，添加到列表中
         else:
             # 备用方案：使用 API 接口 (如果网页解析失败)
             print("网页解析失败，尝试备用 API 接口...")
             api_url = f"https://www.pixiv.net/ranking.php?mode={mode}&format=json"
-            api_response = requests.get(api_url, headers=headers)
+            api_response = http_get(api_url, headers=headers, use_cache=True,
+                                timeout=get_request_timeout("pixiv"))
             api_response.raise_for_status()
-            data = api_response.json()
-            illusts = data.get("contents", [])[:limit] # API 接口结构通常是 contents
-        # 下载图片函数
-        def download_image(img_url, img_path):
-            if os.path.exists(img_path) and os.path.getsize(img_path) > 0:
-                return True
-            try:
-                response = requests.get(img_url, headers=headers, timeout=10)
-                if response.status_code == 200:
-                    with open(img_path, 'wb') as f:
-                        f.write(response.content)
-                    return True
-            except Exception as e:
-                print(f"下载图片失败 {img_url}: {e}")
-                return False
+            illusts = parse_response(api_response, f"pixiv:{limit}",
+                                     lambda r: r.json().get("contents", [])[:limit]) # API 接口结构通常是 contents
         artworks = []
+        jobs = []
         for item in illusts:
             illust_id = item.get("illust_id", item.get("illustId", ""))
             if not illust_id:
                 continue
-            # 构建本地路径
-            image_path = os.path.join(image_dir, f"{illust_id}.jpg")
             # 使用本地代理可能导致图片无法正常下载，改用原始图片链接
             original_url = item.get("url", "")  # 这里需要获取原始大图地址
-            if not download_image(original_url, image_path):
-                image_path = ""  # 下载失败时保留空路径
+            jobs.append((str(illust_id), original_url))
             artworks.append(PixivArtwork(
                 title=item.get("title", "无标题"),
                 url=f"https://www.pixiv.net/artworks/{illust_id}",
-                image_url=image_path or "/static/placeholder.jpg",  # 提供默认占位图
+                image_url="",
                 author=item.get("user_name", "未知作者"),
                 author_url=f"https://www.pixiv.net/users/{item.get('user_id', '')}",
                 width=item.get("width", 0),
                 height=item.get("height", 0),
                 bookmarks=item.get("bookmarks", 0)
             ))
+        # 并发下载图片 (图片库中已有的直接复用), 日期目录中只记录引用
+        paths = store_images(jobs, headers, CONFIG.get("pixiv", {}))
+        refs = {}
+        for artwork, (illust_id, _), path in zip(artworks, jobs, paths):
+            if path:
+                artwork.image_url = path.replace(os.sep, "/")
+                refs[illust_id] = artwork.image_url
+            else:
+                artwork.image_url = "/static/placeholder.jpg"  # 下载失败时提供默认占位图
+        if refs:
+            write_image_refs(image_dir, refs)
+        downloaded = [artwork for artwork, path in zip(artworks, paths) if path]
+        thumbnails = build_thumbnails([artwork.image_url for artwork in downloaded],
+                                      CONFIG.get("pixiv", {}).get("thumbnails", {}))
+        store = get_image_store()
+        for artwork, variants in zip(downloaded, thumbnails):
+            artwork.thumbnails = variants
+            store.refresh_size(item_key("pixiv", artwork))
+        store.save()
         return artworks
     except Exception as e:
         print(f"获取Pixiv排行榜失败: {e}")
         return []
 
 
+# =============== 图片下载 ===============
+def _stream_to_temp(img_url: str, directory: str, headers: Dict, timeout: float,
+                    max_bytes: int) -> Optional[Tuple[str, str, int]]:
+    """流式下载到 directory 中的临时文件, 返回 (临时文件路径, 内容sha256, 字节数), 失败返回 None"""
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = None
+    try:
+        with get_rate_limiter().in_flight(img_url):  # 整个下载过程占用该主机的并发名额
+            deadline = time.monotonic() + min(timeout, run_time_remaining() or timeout)
+            with http_get(img_url, headers=headers, timeout=timeout, stream=True) as response:
+                if response.status_code != 200:
+                    return None
+                content_length = int(response.headers.get("Content-Length") or 0)
+                if max_bytes and content_length > max_bytes:
+                    print(f"图片过大, 跳过 {img_url}: {content_length} 字节")
+                    return None
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+                received = 0
+                digest = hashlib.sha256()
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        received += len(chunk)
+                        if max_bytes and received > max_bytes:
+                            raise ValueError(f"超过大小上限 {max_bytes} 字节")
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"超过 {timeout} 秒仍未下载完成")
+                        digest.update(chunk)
+                        f.write(chunk)
+                os.chmod(tmp_path, 0o644)  # mkstemp 创建的文件默认只有属主可读
+                result = (tmp_path, digest.hexdigest(), received)
+                tmp_path = None
+                return result
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class ImageStore:
+    """按内容寻址的图片库: <目录>/<作品ID>/<内容哈希>.<扩展名>
+
+    索引 (index.json) 记录 作品ID -> 来源URL、文件、占用字节数 (含缩略图) 和最后一次被引用的时间,
+    来源URL不变时直接复用已有文件, 不访问网络; 内容相同的图片只保存一份。
+    清理时只根据索引挑选要删除的作品, 不需要扫描目录树。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+        for key, entry in self._index.items():  # 旧版本的索引没有大小和引用时间
+            if "size" not in entry or "last_ref" not in entry:
+                entry.setdefault("last_ref", time.time())
+                entry["size"] = self._group_size(key, entry["file"])
+                self._dirty = True
+
+    def _group_files(self, key: str, relative: str) -> List[str]:
+        """作品目录中属于该图片的文件 (原图和由它生成的缩略图)"""
+        directory = os.path.join(self.directory, key)
+        prefix = os.path.splitext(os.path.basename(relative))[0] + "."
+        try:
+            return [entry.path for entry in os.scandir(directory) if entry.name.startswith(prefix)]
+        except OSError:
+            return []
+
+    def _group_size(self, key: str, relative: str) -> int:
+        total = 0
+        for path in self._group_files(key, relative):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _remove_group(self, key: str, relative: str) -> None:
+        for path in self._group_files(key, relative):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            os.rmdir(os.path.join(self.directory, key))  # 目录中还有其他文件时保留
+        except OSError:
+            pass
+
+    def lookup(self, key: str, url: str) -> Optional[str]:
+        """该作品已用同一来源URL保存过时返回文件路径 (并记录这次引用)"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry and entry["url"] == url:
+                entry["last_ref"] = time.time()
+                self._dirty = True
+            else:
+                entry = None
+        if entry is not None:
+            path = os.path.join(self.directory, entry["file"])
+            if os.path.exists(path):
+                return path
+        return None
+
+    def add(self, key: str, url: str, tmp_path: str, digest: str) -> str:
+        """把下载好的临时文件放入图片库 (相同内容已存在时丢弃临时文件), 返回文件路径"""
+        extension = os.path.splitext(urlsplit(url).path)[1].lower() or ".jpg"
+        relative = os.path.join(key, digest[:16] + extension)
+        path = os.path.join(self.directory, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        with self._lock:
+            previous = self._index.get(key)
+            self._index[key] = {"url": url, "file": relative, "size": os.path.getsize(path), "last_ref": time.time()}
+            self._dirty = True
+        if previous and previous["file"] != relative:
+            self._remove_group(key, previous["file"])  # 作品图片更新后旧版本不再被引用
+        return path
+
+    def refresh_size(self, key: str) -> None:
+        """生成缩略图后重新统计该作品占用的字节数"""
+        with self._lock:
+            entry = self._index.get(key)
+        if entry is None:
+            return
+        size = self._group_size(key, entry["file"])
+        with self._lock:
+            if entry.get("size") != size:
+                entry["size"] = size
+                self._dirty = True
+
+    def total_size(self) -> int:
+        with self._lock:
+            return sum(entry.get("size", 0) for entry in self._index.values())
+
+    def collect_garbage(self, max_bytes: int, max_age: float, max_evictions: int,
+                        protected: set = frozenset()) -> Tuple[int, int]:
+        """按最后引用时间从旧到新删除作品, 直到总大小不超过 max_bytes 且没有超过 max_age 的作品
+
+        protected 中的作品 (当前页面上的) 不删除, 每次最多删除 max_evictions 个。返回 (删除数, 释放字节数)。
+        """
+        cutoff = time.time() - max_age if max_age else 0
+        with self._lock:
+            total = sum(entry.get("size", 0) for entry in self._index.values())
+            victims = []
+            for key, entry in sorted(self._index.items(), key=lambda kv: kv[1].get("last_ref", 0)):
+                if len(victims) >= max_evictions:
+                    break
+                if key in protected:
+                    continue
+                if total <= max_bytes and entry.get("last_ref", 0) >= cutoff:
+                    break  # 之后的作品都更新, 不需要再删除
+                victims.append((key, entry))
+                total -= entry.get("size", 0)
+            for key, _ in victims:
+                del self._index[key]
+            if victims:
+                self._dirty = True
+        for key, entry in victims:
+            self._remove_group(key, entry["file"])
+        self.save()
+        return len(victims), sum(entry.get("size", 0) for _, entry in victims)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            content = json.dumps(self._index, ensure_ascii=False)
+            self._dirty = False
+        atomic_write(self.index_path, content)
+
+    def fetch(self, key: str, url: str, headers: Dict, timeout: float = 10, max_bytes: int = 0) -> Optional[str]:
+        """取得作品图片的本地路径: 已保存的直接返回, 否则下载后放入图片库 (失败返回 None)"""
+        metrics = get_run_metrics()
+        path = self.lookup(key, url)
+        if path is not None:
+            metrics.incr("images_cached")
+            return path
+        if not url or run_time_remaining() == 0:  # 超过运行截止时间后不再下载
+            return None
+        start = time.perf_counter()
+        try:
+            downloaded = _stream_to_temp(url, self.directory, headers, timeout, max_bytes)
+            if downloaded is None:
+                return None
+            tmp_path, digest, received = downloaded
+            path = self.add(key, url, tmp_path, digest)
+            metrics.incr("images_downloaded")
+            metrics.incr("image_bytes", received)
+            metrics.add_stage("image_download", time.perf_counter() - start)  # 各线程耗时之和
+            return path
+        except Exception as e:
+            print(f"下载图片失败 {url}: {e}")
+            metrics.incr("images_failed")
+            return None
+
+_image_store = None
+_image_store_lock = threading.Lock()
+
+def get_image_store() -> ImageStore:
+    """获取共享的图片库"""
+    global _image_store
+    if _image_store is None:
+        with _image_store_lock:
+            if _image_store is None:
+                _image_store = ImageStore(os.path.join(image_root(CONFIG), "store"))
+    return _image_store
+
+def image_root(config: Dict) -> str:
+    """Pixiv 图片的根目录, 图片库和各日期目录都在其中"""
+    return config.get("pixiv", {}).get("image_dir", "images")
+
+def store_images(jobs: List[Tuple[str, str]], headers: Dict, config: Dict) -> List[Optional[str]]:
+    """并发把多张图片放入图片库, jobs 为 (作品ID, 图片URL) 列表, 返回对应的本地路径 (失败为 None)"""
+    if not jobs:
+        return []
+    store = get_image_store()
+    max_workers = max(1, min(config.get("download_workers", 8), len(jobs)))
+    timeout = config.get("image_timeout", 10)
+    max_bytes = config.get("max_image_bytes", 0)
+    metrics = get_run_metrics()  # 下载线程的统计记入调用方的收集器
+
+    def fetch(job: Tuple[str, str]) -> Optional[str]:
+        with use_run_metrics(metrics):
+            return store.fetch(job[0], job[1], headers, timeout=timeout, max_bytes=max_bytes)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image") as executor:
+        paths = list(executor.map(fetch, jobs))
+    store.save()
+    return paths
+
+def collect_image_garbage(data: Dict[str, List], config: Dict, metrics: RunMetrics) -> None:
+    """按磁盘预算和最长保留时间清理图片库, 并删除过期的日期目录 (当前页面上的作品不受影响)"""
+    gc_config = config.get("pixiv", {}).get("image_cache", {})
+    if not gc_config.get("enabled"):
+        return
+    store = get_image_store()
+    max_age = gc_config.get("max_age_days", 30) * 86400
+    protected = {item_key("pixiv", artwork) for artwork in data.get("pixiv") or []}
+    with metrics.stage("image_gc"):
+        evicted, freed = store.collect_garbage(gc_config.get("max_bytes", 1024 ** 3), max_age,
+                                               gc_config.get("max_evictions", 500), protected)
+        # 日期目录中只有 refs.json, 按目录名判断是否过期
+        images_root = image_root(config)
+        cutoff = datetime.now().timestamp() - max_age
+        for name in os.listdir(images_root) if max_age and os.path.isdir(images_root) else []:
+            try:
+                day = datetime.strptime(name, "%Y-%m-%d")
+            except ValueError:
+                continue
+            if day.timestamp() < cutoff:
+                shutil.rmtree(os.path.join(images_root, name), ignore_errors=True)
+    metrics.incr("images_evicted", evicted)
+    metrics.incr("image_bytes_freed", freed)
+    if evicted:
+        print(f"图片库清理: 删除 {evicted} 个作品, 释放 {freed / 1024 / 1024:.1f} MB, 当前 {store.total_size() / 1024 / 1024:.1f} MB")
+
+def write_image_refs(date_dir: str, refs: Dict[str, str]) -> None:
+    """在日期目录中记录当天引用的图片 (作品ID -> 图片库中的路径), 与当天已有的记录合并"""
+    path = os.path.join(date_dir, "refs.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            existing = json.load(f)
+    except (OSError, ValueError):
+        existing = {}
+    merged = dict(existing, **refs)
+    if merged != existing:
+        atomic_write(path, json.dumps(merged, ensure_ascii=False, indent=2))
+
+
+# =============== 缩略图 ===============
+THUMBNAIL_SAVE_OPTIONS = {
+    "avif": ("AVIF", ".avif", {}),
+    "webp": ("WEBP", ".webp", {"method": 6}),
+    "jpeg": ("JPEG", ".jpg", {"optimize": True, "progressive": True})
+}
+
+def supported_thumbnail_formats(formats: List[str]) -> List[str]:
+    """筛选出当前 Pillow 能够编码的格式"""
+    if not PILLOW_AVAILABLE:
+        return []
+    return [fmt for fmt in formats
+            if fmt in THUMBNAIL_SAVE_OPTIONS and (fmt == "jpeg" or pil_features.check(fmt))]
+
+def thumbnail_path(image_path: str, width: int, fmt: str) -> str:
+    """缩略图路径, 与原图放在一起, 例如 images/store/123/<内容哈希>.w400.webp"""
+    return f"{os.path.splitext(image_path)[0]}.w{width}{THUMBNAIL_SAVE_OPTIONS[fmt][1]}"
+
+def _render_thumbnails(image_path: str, targets: List[Tuple[str, int, str]], quality: Dict[str, int]) -> None:
+    """(在子进程中) 把一张图片按 4:3 居中裁剪缩放后写出各目标格式和宽度"""
+    with Image.open(image_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for fmt, width, path in targets:
+            size = (width, width * 3 // 4)
+            if image.width < size[0]:  # 不放大, 只裁剪成卡片比例
+                size = (image.width, image.width * 3 // 4)
+            thumbnail = ImageOps.fit(image, size, Image.LANCZOS)
+            pil_format, _, options = THUMBNAIL_SAVE_OPTIONS[fmt]
+            with atomic_open(path) as f:
+                thumbnail.save(f, pil_format, quality=quality.get(fmt, 80), **options)
+
+def build_thumbnails(image_paths: List[str], config: Dict) -> List[Optional[Dict[str, List]]]:
+    """为图片生成卡片尺寸缩略图 (已存在的跳过, 其余在进程池中并行生成), 返回与 image_paths 对应的 格式 -> [[宽度, 路径]]"""
+    formats = supported_thumbnail_formats(config.get("formats", ["jpeg"])) if config.get("enabled") else []
+    if not image_paths or "jpeg" not in formats:  # 没有 jpeg 兜底时不使用缩略图
+        return [None] * len(image_paths)
+    if run_time_remaining() == 0:  # 已超过运行截止时间, 页面直接使用原图
+        return [None] * len(image_paths)
+    widths = sorted(config.get("widths", [400]))
+    variants = []
+    jobs = []
+    for image_path in image_paths:
+        try:
+            with Image.open(image_path) as image:  # 只读取文件头
+                # EXIF 方向为旋转 90° 时, 摆正后的宽度是存储的高度
+                source_width = image.height if image.getexif().get(0x0112) in (5, 6, 7, 8) else image.width
+        except Exception as e:
+            print(f"无法读取图片 {image_path}: {e}")
+            variants.append(None)
+            continue
+        # 不生成比原图更宽的版本; 原图比最小宽度还窄时按原图宽度生成一个版本, 路径和 srcset 都使用实际宽度
+        usable = [width for width in widths if width <= source_width] or [source_width]
+        variants.append({fmt: [[width, thumbnail_path(image_path, width, fmt)] for width in usable] for fmt in formats})
+        targets = [(fmt, width, path) for fmt, entries in variants[-1].items()
+                   for width, path in entries if not os.path.exists(path)]
+        if targets:
+            jobs.append((image_path, targets))
+    if not jobs:
+        return variants
+
+    metrics = get_run_metrics()
+    quality = config.get("quality", {})
+    max_workers = max(1, min(config.get("workers") or os.cpu_count() or 1, len(jobs)))
+    failed = set()
+    with metrics.stage("thumbnails"):
+        # 调用方运行在获取线程中, 用 spawn 而不是 fork, 避免子进程继承其他线程持有的锁
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(_render_thumbnails, image_path, targets, quality): image_path
+                       for image_path, targets in jobs}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    metrics.incr("thumbnails_built")
+                except Exception as e:
+                    print(f"生成缩略图失败 {futures[future]}: {e}")
+                    failed.add(futures[future])
+                    metrics.incr("thumbnails_failed")
+    return [None if image_path in failed else entry for image_path, entry in zip(image_paths, variants)]
+
+
 # =============== 辅助函数 ===============
 # (辅助函数保持不变 - 来源于你提供的文件)
 def format_number(num):
@@ -396,679 +1962,2024 @@ def format_duration(seconds):
     return f"{m:02d}:{s:02d}"
 
 # =============== HTML生成函数 (修改版) ===============
-def generate_html(data: Dict[str, List], config: Dict) -> str:
-    """生成HTML报告"""
-    date_str = datetime.now().strftime("%Y年%m月%d日") # 使用你文件中的日期格式
-
-    theme = config.get("theme", "default")
-
-    # --- 主题配置 (使用你文件中的配置) ---
-    themes = {
-        "default": {
-            "name": "浅蓝色调的烂大街配色",
-            "vars": {
-                "primary-color": "#1e90ff",
-                "primary-light": "rgba(30, 144, 255, 0.2)",
-                "primary-dark": "#0066cc",
-                "secondary-color": "#ffffff",
-                "bg-color": "#e6f2ff",
-                "card-bg": "rgba(255, 255, 255, 0.9)",
-                "text-color": "#333",
-                "text-light": "#666",
-                "border-color": "rgba(30, 144, 255, 0.3)",
-                "highlight-color": "#ffcc00",
-                "success-color": "#2ecc71",
-                "danger-color": "#ff4757",
-                "warning-color": "#f39c12",
-                "shadow": "0 4px 12px rgba(30, 144, 255, 0.2)",
-                "transition": "all 0.3s ease",
-                "bg-image": "none",
-                "header-bg": "transparent"
-            }
-        },
-        "dark": {
-            "name": "Do U like van 游戏",
-            "vars": {
-                "primary-color": "#8a2be2",
-                "primary-light": "rgba(138, 43, 226, 0.2)",
-                "primary-dark": "#5f1e9e",
-                "secondary-color": "#ffffff",
-                "bg-color": "#121212",
-                "card-bg": "#1e1e1e",
-                "text-color": "#e0e0e0",
-                "text-light": "#b0b0b0",
-                "border-color": "#333",
-                "highlight-color": "#ff9f1c",
-                "success-color": "#2ecc71",
-                "danger-color": "#ff4757",
-                "warning-color": "#f39c12",
-                "shadow": "0 4px 12px rgba(0, 0, 0, 0.4)",
-                "transition": "all 0.3s ease",
-                "bg-image": "linear-gradient(135deg, #121212 0%, #2d2d2d 100%)",
-                "header-bg": "rgba(30, 30, 30, 0.7)"
-            }
-        },
-        "green": {
-            "name": "原谅绿",
-            "vars": {
-                "primary-color": "#2e8b57",
-                "primary-light": "rgba(46, 139, 87, 0.2)",
-                "primary-dark": "#1f6f42",
-                "secondary-color": "#ffffff",
-                "bg-color": "#f5fef5",
-                "card-bg": "rgba(255, 255, 255, 0.95)",
-                "text-color": "#2d3748",
-                "text-light": "#4a5568",
-                "border-color": "rgba(46, 139, 87, 0.3)",
-                "highlight-color": "#f6ad55",
-                "success-color": "#38a169",
-                "danger-color": "#e53e3e",
-                "warning-color": "#dd6b20",
-                "shadow": "0 4px 12px rgba(46, 139, 87, 0.1)",
-                "transition": "all 0.3s ease",
-                "bg-image": "linear-gradient(135deg, #f5fef5 0%, #e6ffed 100%)",
-                "header-bg": "rgba(245, 254, 245, 0.9)"
-            }
-        },
-        "classic": {
-            "name": "苦来兮苦（经典咖啡色）",
-            "vars": {
-                "primary-color": "#6d4c41",
-                "primary-light": "rgba(109, 76, 65, 0.2)",
-                "primary-dark": "#4e342e",
-                "secondary-color": "#ffffff",
-                "bg-color": "#f5f5f5",
-                "card-bg": "rgba(255, 255, 255, 0.95)",
-                "text-color": "#3e2723",
-                "text-light": "#5d4037",
-                "border-color": "rgba(109, 76, 65, 0.3)",
-                "highlight-color": "#8d6e63",
-                "success-color": "#689f38",
-                "danger-color": "#d32f2f",
-                "warning-color": "#f57c00",
-                "shadow": "0 4px 12px rgba(109, 76, 65, 0.1)",
-                "transition": "all 0.3s ease",
-                "bg-image": "linear-gradient(135deg, #f5f5f5 0%, #efebe9 100%)",
-                "header-bg": "rgba(245, 245, 245, 0.9)"
-            }
+# --- 主题配置 (使用你文件中的配置) ---
+THEMES = {
+    "default": {
+        "name": "浅蓝色调的烂大街配色",
+        "vars": {
+            "primary-color": "#1e90ff",
+            "primary-light": "rgba(30, 144, 255, 0.2)",
+            "primary-dark": "#0066cc",
+            "secondary-color": "#ffffff",
+            "bg-color": "#e6f2ff",
+            "card-bg": "rgba(255, 255, 255, 0.9)",
+            "text-color": "#333",
+            "text-light": "#666",
+            "border-color": "rgba(30, 144, 255, 0.3)",
+            "highlight-color": "#ffcc00",
+            "success-color": "#2ecc71",
+            "danger-color": "#ff4757",
+            "warning-color": "#f39c12",
+            "shadow": "0 4px 12px rgba(30, 144, 255, 0.2)",
+            "transition": "all 0.3s ease",
+            "bg-image": "none",
+            "header-bg": "transparent"
+        }
+    },
+    "dark": {
+        "name": "Do U like van 游戏",
+        "vars": {
+            "primary-color": "#8a2be2",
+            "primary-light": "rgba(138, 43, 226, 0.2)",
+            "primary-dark": "#5f1e9e",
+            "secondary-color": "#ffffff",
+            "bg-color": "#121212",
+            "card-bg": "#1e1e1e",
+            "text-color": "#e0e0e0",
+            "text-light": "#b0b0b0",
+            "border-color": "#333",
+            "highlight-color": "#ff9f1c",
+            "success-color": "#2ecc71",
+            "danger-color": "#ff4757",
+            "warning-color": "#f39c12",
+            "shadow": "0 4px 12px rgba(0, 0, 0, 0.4)",
+            "transition": "all 0.3s ease",
+            "bg-image": "linear-gradient(135deg, #121212 0%, #2d2d2d 100%)",
+            "header-bg": "rgba(30, 30, 30, 0.7)"
+        }
+    },
+    "green": {
+        "name": "原谅绿",
+        "vars": {
+            "primary-color": "#2e8b57",
+            "primary-light": "rgba(46, 139, 87, 0.2)",
+            "primary-dark": "#1f6f42",
+            "secondary-color": "#ffffff",
+            "bg-color": "#f5fef5",
+            "card-bg": "rgba(255, 255, 255, 0.95)",
+            "text-color": "#2d3748",
+            "text-light": "#4a5568",
+            "border-color": "rgba(46, 139, 87, 0.3)",
+            "highlight-color": "#f6ad55",
+            "success-color": "#38a169",
+            "danger-color": "#e53e3e",
+            "warning-color": "#dd6b20",
+            "shadow": "0 4px 12px rgba(46, 139, 87, 0.1)",
+            "transition": "all 0.3s ease",
+            "bg-image": "linear-gradient(135deg, #f5fef5 0%, #e6ffed 100%)",
+            "header-bg": "rgba(245, 254, 245, 0.9)"
+        }
+    },
+    "classic": {
+        "name": "苦来兮苦（经典咖啡色）",
+        "vars": {
+            "primary-color": "#6d4c41",
+            "primary-light": "rgba(109, 76, 65, 0.2)",
+            "primary-dark": "#4e342e",
+            "secondary-color": "#ffffff",
+            "bg-color": "#f5f5f5",
+            "card-bg": "rgba(255, 255, 255, 0.95)",
+            "text-color": "#3e2723",
+            "text-light": "#5d4037",
+            "border-color": "rgba(109, 76, 65, 0.3)",
+            "highlight-color": "#8d6e63",
+            "success-color": "#689f38",
+            "danger-color": "#d32f2f",
+            "warning-color": "#f57c00",
+            "shadow": "0 4px 12px rgba(109, 76, 65, 0.1)",
+            "transition": "all 0.3s ease",
+            "bg-image": "linear-gradient(135deg, #f5f5f5 0%, #efebe9 100%)",
+            "header-bg": "rgba(245, 245, 245, 0.9)"
         }
     }
+}
 
-    selected_theme = themes.get(theme, themes["default"])
-    theme_vars = selected_theme["vars"] # 获取变量字典
-
-    # --- CSS样式 (修改版) ---
-    css = f"""
-    <style>
-        :root {{
-            --primary-color: {theme_vars["primary-color"]};
-            --primary-light: {theme_vars["primary-light"]};
-            --primary-dark: {theme_vars["primary-dark"]};
-            --secondary-color: {theme_vars["secondary-color"]};
-            --bg-color: {theme_vars["bg-color"]};
-            --card-bg: {theme_vars["card-bg"]};
-            --text-color: {theme_vars["text-color"]};
-            --text-light: {theme_vars["text-light"]};
-            --border-color: {theme_vars["border-color"]};
-            --highlight-color: {theme_vars["highlight-color"]};
-            --success-color: {theme_vars["success-color"]};
-            --danger-color: {theme_vars["danger-color"]};
-            --warning-color: {theme_vars["warning-color"]};
-            --shadow: {theme_vars["shadow"]};
-            --transition: {theme_vars["transition"]};
-            --bg-image: {theme_vars["bg-image"]}; /* 添加背景图像变量 */
-            --header-bg: {theme_vars["header-bg"]}; /* 添加header背景变量 */
-        }}
-
-        * {{
-            box-sizing: border-box;
-            margin: 0;
-            padding: 0;
-        }}
-
-        body {{
-            font-family: 'Segoe UI', 'Helvetica Neue', 'PingFang SC', 'Microsoft YaHei', sans-serif;
-            line-height: 1.6;
-            margin: 0;
-            padding: 20px 0; /* 在 body 上加垂直 padding */
-            background-color: var(--bg-color); /* 使用背景色 */
-            background-image: var(--bg-image); /* 使用背景图像 */
-            color: var(--text-color);
-            min-height: 100vh;
-            background-attachment: fixed; /* 固定背景 */
-            background-size: cover; /* 覆盖整个视口 */
-        }}
-
-        .container {{
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 0 20px; /* 容器左右 padding */
-        }}
-
-        header {{
-            text-align: center;
-            margin-bottom: 30px;
-            padding: 20px;
-            border-bottom: 1px solid var(--border-color);
-            background: var(--header-bg); /* 使用 header 背景变量 */
-            border-radius: 10px;
-            backdrop-filter: blur(8px); /* 轻微模糊效果 */
-            /* 移除 position: sticky */
-        }}
-
-        h1 {{
-            color: var(--primary-dark);
-            font-size: 2.5rem;
-            margin-bottom: 10px;
-            font-weight: 600;
-        }}
-
-        .date {{
-            color: var(--text-light); /* 使用浅色文本 */
-            font-size: 0.9rem;
-            opacity: 0.8;
-        }}
-
-        .section {{
-            margin-bottom: 40px;
-            background: var(--card-bg);
-            border-radius: 10px;
-            box-shadow: var(--shadow);
-            padding: 25px;
-            transition: var(--transition);
-            border: 1px solid var(--border-color);
-            backdrop-filter: blur(5px); /* 卡片背景模糊 */
-            overflow: hidden; /* 防止内部元素溢出 */
-        }}
-
-        h2 {{
-            color: var(--primary-dark);
-            font-size: 1.6rem; /* 稍微增大标题 */
-            margin-bottom: 20px;
-            padding-bottom: 10px;
-            border-bottom: 2px solid var(--primary-light); /* 使用浅主色调 */
-            display: flex;
-            align-items: center;
-            gap: 10px; /* emoji 和文字间距 */
-            font-weight: 500; /* 字体稍细 */
-        }}
-         h2 .emoji {{ /* 为 emoji 添加样式 */
-            font-size: 1.3em; /* 让 emoji 稍微大一点 */
-            display: inline-block;
-            line-height: 1;
-         }}
-
-        .items {{
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            gap: 20px;
-        }}
-
-        .item {{
-            border: 1px solid var(--border-color);
-            border-radius: 10px;
-            padding: 18px;
-            transition: var(--transition);
-            background: var(--card-bg);
-            display: flex;
-            flex-direction: column;
-            height: 100%; /* 确保项目高度一致 */
-            position: relative; /* 用于可能的绝对定位子元素 */
-            overflow: hidden; /* 防止内容溢出 */
-        }}
-
-        .item:hover {{
-            transform: translateY(-5px) scale(1.01); /* 悬停效果微调 */
-            box-shadow: 0 8px 20px {theme_vars["primary-light"].replace('0.2', '0.3')}; /* 悬停阴影加深 */
-            border-color: var(--primary-color);
-        }}
-
-        /* GitHub项目样式 (保持不变) */
-        .github-item {{ }}
-        .github-item h3 {{
-            font-size: 1.1rem; margin-bottom: 10px; line-height: 1.4;
-            display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
-            overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
-        }}
-        .github-item p {{
-            color: var(--text-light); font-size: 0.9rem; margin-bottom: 12px; flex-grow: 1;
-            display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
-            overflow: hidden; text-overflow: ellipsis;
-        }}
-        .github-item .meta {{
-            display: flex; align-items: center; flex-wrap: wrap; gap: 10px; margin-top: auto;
-            border-top: 1px solid var(--border-color); padding-top: 10px; /* 添加分隔线 */
-        }}
-        .github-item .language {{
-            display: inline-flex; align-items: center; padding: 3px 10px;
-            background: var(--primary-light); border-radius: 20px; font-size: 0.8rem;
-            color: var(--primary-color); font-weight: 500;
-        }}
-        .github-item .stats {{
-            display: flex; gap: 12px; font-size: 0.8rem; color: var(--text-light);
-            margin-left: auto; /* 推到右边 */
-        }}
-
-        /* B站视频样式 (保持不变) */
-        .bilibili-item {{ display: flex; gap: 15px; }}
-        .bilibili-cover-link {{ display: block; flex-shrink: 0;}} /* 包裹图片链接 */
-        .bilibili-cover {{
-            width: 120px; height: 80px; object-fit: cover; border-radius: 8px;
-            transition: var(--transition); display: block;
-        }}
-        .bilibili-item:hover .bilibili-cover {{ transform: scale(1.05); }}
-        .bilibili-info {{ flex: 1; display: flex; flex-direction: column; }}
-        .bilibili-info h3 {{
-            font-size: 1rem; margin-bottom: 8px; line-height: 1.4;
-            display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
-            overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
-        }}
-        .up-name {{ color: var(--text-light); font-size: 0.85rem; margin-bottom: 8px; }}
-        .bilibili-stats {{
-            display: flex; flex-wrap: wrap; gap: 12px; font-size: 0.8rem; color: var(--text-light);
-            margin-top: auto; border-top: 1px solid var(--border-color); padding-top: 8px; /* 分隔线 */
-        }}
-        .bilibili-stats span {{ display: inline-flex; align-items: center; gap: 4px; }} /* 图标和文字间距 */
-
-        /* --- 微博热搜样式 (修改) --- */
-        .weibo-item {{
-            padding: 15px;
-            border-radius: 8px;
-            /* background: var(--card-bg); /* 统一背景在 .item */
-            transition: var(--transition);
-            display: flex; /* 使用 flex 布局 */
-            flex-direction: column;
-        }}
-
-        .weibo-content {{ /* 容器 */
-             display: flex;
-             flex-direction: column;
-             flex-grow: 1; /* 占据剩余空间 */
-        }}
-
-        .weibo-content h3 {{ /* 标题部分 */
-            font-size: 1.05rem; /* 稍大一点 */
-            margin-bottom: 10px; /* 增加标题和下方间距 */
-            color: var(--text-color);
-            font-weight: 500; /* 字体调整 */
-            line-height: 1.45;
-             display: -webkit-box; -webkit-line-clamp: 3; -webkit-box-orient: vertical; /* 最多3行 */
-             overflow: hidden; text-overflow: ellipsis;
-        }}
-        .weibo-content h3 a {{ color: inherit; text-decoration: none; }} /* 继承颜色 */
-        .weibo-content h3 a:hover {{ color: var(--primary-color); }}
-
-        .weibo-meta {{ /* 热度和标签容器 */
-            display: flex;
-            align-items: center;
-            gap: 8px; /* 热度和标签间距 */
-            margin-top: auto; /* 推到底部 */
-            padding-top: 10px; /* 与上方内容间距 */
-            border-top: 1px solid var(--border-color); /* 分隔线 */
-            flex-wrap: wrap; /* 允许换行 */
-        }}
-
-        .weibo-hot {{ /* 热度 */
-            font-size: 0.9rem;
-            color: var(--danger-color);
-            font-weight: bold;
-            white-space: nowrap; /* 不换行 */
-            order: 1; /* 热度靠前 */
-        }}
-        .weibo-hot::before {{ content: '🔥 '; }}
-
-        .weibo-label {{ /* 标签 */
-            font-size: 0.7rem;
-            padding: 2px 6px;
-            border-radius: 3px;
-            color: white;
-            text-transform: uppercase;
-            font-weight: bold;
-            line-height: 1;
-            white-space: nowrap;
-            order: 2; /* 标签在后 */
-        }}
-        .weibo-label.hot {{ background-color: var(--warning-color); }}
-        .weibo-label.new {{ background-color: var(--success-color); }}
-        .weibo-label.boom {{ background-color: var(--danger-color); animation: pulse 1.2s infinite ease-in-out; }}
-        .weibo-label.boil {{ background-color: var(--info-color, var(--primary-color)); }} /* Fallback color */
-        .weibo-label.recommend {{ background-color: var(--primary-color); }}
-        /* --- 微博样式修改结束 --- */
-
-        /* 知乎热榜样式 (保持不变) */
-        .zhihu-item {{ padding: 15px; border-radius: 8px; transition: var(--transition); }}
-        .zhihu-item h3 {{
-            font-size: 1.05rem; /* 稍大 */ margin-bottom: 12px; line-height: 1.4;
-            display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
-            overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
-        }}
-         .zhihu-item h3 a {{ color: inherit; text-decoration: none; }}
-         .zhihu-item h3 a:hover {{ color: var(--primary-color); }}
-        .zhihu-meta {{
-            display: flex; justify-content: space-between; align-items: center;
-            margin-top: auto; border-top: 1px solid var(--border-color); padding-top: 10px;
-        }}
-        .zhihu-hot {{
-            font-size: 0.9rem; color: var(--danger-color); font-weight: bold;
-            background: color-mix(in srgb, var(--danger-color) 10%, transparent); /* 调整混合比例 */
-            padding: 3px 8px; border-radius: 10px; white-space: nowrap;
-        }}
-         .zhihu-hot::before {{ content: '💡 '; }} /* 换个图标 */
-        .zhihu-stats {{
-            display: flex; gap: 12px; font-size: 0.85rem; color: var(--text-light);
-        }}
-        .zhihu-stats span {{ display: inline-flex; align-items: center; gap: 4px; }}
-
-        /* Pixiv排行榜样式 (保持不变) */
-        .pixiv-item {{ }}
-        .pixiv-image-container {{
-            position: relative; padding-top: 75%; /* 4:3 ratio */
-            overflow: hidden; border-radius: 8px; margin-bottom: 12px;
-            background: var(--border-color); /* 占位背景 */
-        }}
-        .pixiv-image {{
-            position: absolute; top: 0; left: 0; width: 100%; height: 100%;
-            object-fit: cover; transition: var(--transition); display: block;
-        }}
-        .pixiv-item:hover .pixiv-image {{ transform: scale(1.08); filter: brightness(1.1); }}
-        .pixiv-title {{
-            font-size: 1rem; margin-bottom: 8px; line-height: 1.4;
-            display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
-            overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
-        }}
-        .pixiv-title a {{ color: inherit; text-decoration: none; }}
-        .pixiv-title a:hover {{ color: var(--primary-color); }}
-        .pixiv-author {{ font-size: 0.85rem; color: var(--text-light); margin-bottom: 8px; }}
-        .pixiv-author a {{ color: inherit; text-decoration: none; }}
-        .pixiv-author a:hover {{ color: var(--primary-color); }}
-        .pixiv-stats {{
-            display: flex; justify-content: space-between; gap: 12px; font-size: 0.8rem; color: var(--text-light);
-            margin-top: auto; border-top: 1px solid var(--border-color); padding-top: 8px;
-        }}
-         .pixiv-stats span {{ display: inline-flex; align-items: center; gap: 4px; }}
-
-        /* 链接样式 (保持不变) */
-        a {{ color: var(--text-color); text-decoration: none; transition: var(--transition); }}
-        a:hover {{ color: var(--primary-color); text-decoration: underline; }}
-
-        /* 动画效果 (保持不变) */
-        @keyframes pulse {{
-            0% {{ transform: scale(1); opacity: 1; }}
-            50% {{ transform: scale(1.08); opacity: 0.7; }}
-            100% {{ transform: scale(1); opacity: 1; }}
-        }}
-
-        /* 响应式设计 (保持不变) */
-        @media (max-width: 768px) {{
-            .container {{ padding: 15px; }}
-            h1 {{ font-size: 2rem; }}
-            h2 {{ font-size: 1.4rem; }}
-            .items {{ grid-template-columns: 1fr; gap: 15px; }}
-            .bilibili-item {{ flex-direction: column; }}
-            .bilibili-cover {{ width: 100%; height: auto; aspect-ratio: 16/9; }}
-        }}
-         @media (max-width: 480px) {{
-             body {{ padding: 10px 0; }}
-             .container {{ padding: 0 10px; }}
-             h1 {{ font-size: 1.8rem; }}
-             h2 {{ font-size: 1.3rem; }}
-             .section {{ padding: 15px; }}
-             .item {{ padding: 12px; }}
-         }}
-    </style>
-    """
+# --- CSS样式 (修改版), 按主题变量填充 ---
+CSS_TEMPLATE = """
+:root {{
+    --primary-color: {primary-color};
+    --primary-light: {primary-light};
+    --primary-dark: {primary-dark};
+    --secondary-color: {secondary-color};
+    --bg-color: {bg-color};
+    --card-bg: {card-bg};
+    --text-color: {text-color};
+    --text-light: {text-light};
+    --border-color: {border-color};
+    --highlight-color: {highlight-color};
+    --success-color: {success-color};
+    --danger-color: {danger-color};
+    --warning-color: {warning-color};
+    --shadow: {shadow};
+    --transition: {transition};
+    --bg-image: {bg-image}; /* 添加背景图像变量 */
+    --header-bg: {header-bg}; /* 添加header背景变量 */
+}}
+
+* {{
+    box-sizing: border-box;
+    margin: 0;
+    padding: 0;
+}}
+
+body {{
+    font-family: 'Segoe UI', 'Helvetica Neue', 'PingFang SC', 'Microsoft YaHei', sans-serif;
+    line-height: 1.6;
+    margin: 0;
+    padding: 20px 0; /* 在 body 上加垂直 padding */
+    background-color: var(--bg-color); /* 使用背景色 */
+    background-image: var(--bg-image); /* 使用背景图像 */
+    color: var(--text-color);
+    min-height: 100vh;
+    background-attachment: fixed; /* 固定背景 */
+    background-size: cover; /* 覆盖整个视口 */
+}}
+
+.container {{
+    max-width: 1200px;
+    margin: 0 auto;
+    padding: 0 20px; /* 容器左右 padding */
+}}
+
+header {{
+    text-align: center;
+    margin-bottom: 30px;
+    padding: 20px;
+    border-bottom: 1px solid var(--border-color);
+    background: var(--header-bg); /* 使用 header 背景变量 */
+    border-radius: 10px;
+    backdrop-filter: blur(8px); /* 轻微模糊效果 */
+    /* 移除 position: sticky */
+}}
+
+h1 {{
+    color: var(--primary-dark);
+    font-size: 2.5rem;
+    margin-bottom: 10px;
+    font-weight: 600;
+}}
+
+.date {{
+    color: var(--text-light); /* 使用浅色文本 */
+    font-size: 0.9rem;
+    opacity: 0.8;
+}}
+
+.section {{
+    margin-bottom: 40px;
+    background: var(--card-bg);
+    border-radius: 10px;
+    box-shadow: var(--shadow);
+    padding: 25px;
+    transition: var(--transition);
+    border: 1px solid var(--border-color);
+    backdrop-filter: blur(5px); /* 卡片背景模糊 */
+    overflow: hidden; /* 防止内部元素溢出 */
+}}
+
+h2 {{
+    color: var(--primary-dark);
+    font-size: 1.6rem; /* 稍微增大标题 */
+    margin-bottom: 20px;
+    padding-bottom: 10px;
+    border-bottom: 2px solid var(--primary-light); /* 使用浅主色调 */
+    display: flex;
+    align-items: center;
+    gap: 10px; /* emoji 和文字间距 */
+    font-weight: 500; /* 字体稍细 */
+}}
+ h2 .emoji {{ /* 为 emoji 添加样式 */
+    font-size: 1.3em; /* 让 emoji 稍微大一点 */
+    display: inline-block;
+    line-height: 1;
+ }}
+
+.items {{
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+    gap: 20px;
+}}
+
+.item {{
+    border: 1px solid var(--border-color);
+    border-radius: 10px;
+    padding: 18px;
+    transition: var(--transition);
+    background: var(--card-bg);
+    display: flex;
+    flex-direction: column;
+    height: 100%; /* 确保项目高度一致 */
+    position: relative; /* 用于可能的绝对定位子元素 */
+    overflow: hidden; /* 防止内容溢出 */
+}}
+
+.item:hover {{
+    transform: translateY(-5px) scale(1.01); /* 悬停效果微调 */
+    box-shadow: 0 8px 20px {hover-shadow-color}; /* 悬停阴影加深 */
+    border-color: var(--primary-color);
+}}
+
+/* GitHub项目样式 (保持不变) */
+.github-item {{ }}
+.github-item h3 {{
+    font-size: 1.1rem; margin-bottom: 10px; line-height: 1.4;
+    display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
+    overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
+}}
+.github-item p {{
+    color: var(--text-light); font-size: 0.9rem; margin-bottom: 12px; flex-grow: 1;
+    display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
+    overflow: hidden; text-overflow: ellipsis;
+}}
+.github-item .meta {{
+    display: flex; align-items: center; flex-wrap: wrap; gap: 10px; margin-top: auto;
+    border-top: 1px solid var(--border-color); padding-top: 10px; /* 添加分隔线 */
+}}
+.github-item .language {{
+    display: inline-flex; align-items: center; padding: 3px 10px;
+    background: var(--primary-light); border-radius: 20px; font-size: 0.8rem;
+    color: var(--primary-color); font-weight: 500;
+}}
+.github-item .stats {{
+    display: flex; gap: 12px; font-size: 0.8rem; color: var(--text-light);
+    margin-left: auto; /* 推到右边 */
+}}
+
+/* B站视频样式 (保持不变) */
+.bilibili-item {{ display: flex; gap: 15px; }}
+.bilibili-cover-link {{ display: block; flex-shrink: 0;}} /* 包裹图片链接 */
+.bilibili-cover {{
+    width: 120px; height: 80px; object-fit: cover; border-radius: 8px;
+    transition: var(--transition); display: block;
+}}
+.bilibili-item:hover .bilibili-cover {{ transform: scale(1.05); }}
+.bilibili-info {{ flex: 1; display: flex; flex-direction: column; }}
+.bilibili-info h3 {{
+    font-size: 1rem; margin-bottom: 8px; line-height: 1.4;
+    display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
+    overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
+}}
+.up-name {{ color: var(--text-light); font-size: 0.85rem; margin-bottom: 8px; }}
+.bilibili-stats {{
+    display: flex; flex-wrap: wrap; gap: 12px; font-size: 0.8rem; color: var(--text-light);
+    margin-top: auto; border-top: 1px solid var(--border-color); padding-top: 8px; /* 分隔线 */
+}}
+.bilibili-stats span {{ display: inline-flex; align-items: center; gap: 4px; }} /* 图标和文字间距 */
+
+/* --- 微博热搜样式 (修改) --- */
+.weibo-item {{
+    padding: 15px;
+    border-radius: 8px;
+    /* background: var(--card-bg); /* 统一背景在 .item */
+    transition: var(--transition);
+    display: flex; /* 使用 flex 布局 */
+    flex-direction: column;
+}}
+
+.weibo-content {{ /* 容器 */
+     display: flex;
+     flex-direction: column;
+     flex-grow: 1; /* 占据剩余空间 */
+}}
+
+.weibo-content h3 {{ /* 标题部分 */
+    font-size: 1.05rem; /* 稍大一点 */
+    margin-bottom: 10px; /* 增加标题和下方间距 */
+    color: var(--text-color);
+    font-weight: 500; /* 字体调整 */
+    line-height: 1.45;
+     display: -webkit-box; -webkit-line-clamp: 3; -webkit-box-orient: vertical; /* 最多3行 */
+     overflow: hidden; text-overflow: ellipsis;
+}}
+.weibo-content h3 a {{ color: inherit; text-decoration: none; }} /* 继承颜色 */
+.weibo-content h3 a:hover {{ color: var(--primary-color); }}
+
+.weibo-meta {{ /* 热度和标签容器 */
+    display: flex;
+    align-items: center;
+    gap: 8px; /* 热度和标签间距 */
+    margin-top: auto; /* 推到底部 */
+    padding-top: 10px; /* 与上方内容间距 */
+    border-top: 1px solid var(--border-color); /* 分隔线 */
+    flex-wrap: wrap; /* 允许换行 */
+}}
+
+.weibo-hot {{ /* 热度 */
+    font-size: 0.9rem;
+    color: var(--danger-color);
+    font-weight: bold;
+    white-space: nowrap; /* 不换行 */
+    order: 1; /* 热度靠前 */
+}}
+.weibo-hot::before {{ content: '🔥 '; }}
+
+.weibo-label {{ /* 标签 */
+    font-size: 0.7rem;
+    padding: 2px 6px;
+    border-radius: 3px;
+    color: white;
+    text-transform: uppercase;
+    font-weight: bold;
+    line-height: 1;
+    white-space: nowrap;
+    order: 2; /* 标签在后 */
+}}
+.weibo-label.hot {{ background-color: var(--warning-color); }}
+.weibo-label.new {{ background-color: var(--success-color); }}
+.weibo-label.boom {{ background-color: var(--danger-color); animation: pulse 1.2s infinite ease-in-out; }}
+.weibo-label.boil {{ background-color: var(--info-color, var(--primary-color)); }} /* Fallback color */
+.weibo-label.recommend {{ background-color: var(--primary-color); }}
+/* --- 微博样式修改结束 --- */
+
+/* 与上次运行相比的变化标记 */
+.item-badge {{
+    display: inline-block;
+    font-size: 0.7rem;
+    padding: 1px 6px;
+    margin-right: 6px;
+    border-radius: 3px;
+    color: white;
+    font-weight: bold;
+    line-height: 1.4;
+    vertical-align: middle;
+}}
+.item-badge.new {{ background-color: var(--success-color); }}
+.item-badge.rising {{ background-color: var(--danger-color); }}
+.item-badge.falling {{ background-color: var(--text-light); }}
+.item.item-new {{ box-shadow: inset 3px 0 0 var(--success-color), var(--shadow); }}
+
+/* 知乎热榜样式 (保持不变) */
+.zhihu-item {{ padding: 15px; border-radius: 8px; transition: var(--transition); }}
+.zhihu-item h3 {{
+    font-size: 1.05rem; /* 稍大 */ margin-bottom: 12px; line-height: 1.4;
+    display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
+    overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
+}}
+ .zhihu-item h3 a {{ color: inherit; text-decoration: none; }}
+ .zhihu-item h3 a:hover {{ color: var(--primary-color); }}
+.zhihu-meta {{
+    display: flex; justify-content: space-between; align-items: center;
+    margin-top: auto; border-top: 1px solid var(--border-color); padding-top: 10px;
+}}
+.zhihu-hot {{
+    font-size: 0.9rem; color: var(--danger-color); font-weight: bold;
+    background: color-mix(in srgb, var(--danger-color) 10%, transparent); /* 调整混合比例 */
+    padding: 3px 8px; border-radius: 10px; white-space: nowrap;
+}}
+ .zhihu-hot::before {{ content: '💡 '; }} /* 换个图标 */
+.zhihu-stats {{
+    display: flex; gap: 12px; font-size: 0.85rem; color: var(--text-light);
+}}
+.zhihu-stats span {{ display: inline-flex; align-items: center; gap: 4px; }}
+
+/* Pixiv排行榜样式 (保持不变) */
+.pixiv-item {{ }}
+.pixiv-image-container {{
+    position: relative; padding-top: 75%; /* 4:3 ratio */
+    overflow: hidden; border-radius: 8px; margin-bottom: 12px;
+    background: var(--border-color); /* 占位背景 */
+}}
+.pixiv-image {{
+    position: absolute; top: 0; left: 0; width: 100%; height: 100%;
+    object-fit: cover; transition: var(--transition); display: block;
+}}
+.pixiv-item:hover .pixiv-image {{ transform: scale(1.08); filter: brightness(1.1); }}
+.pixiv-title {{
+    font-size: 1rem; margin-bottom: 8px; line-height: 1.4;
+    display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical;
+    overflow: hidden; text-overflow: ellipsis; color: var(--text-color);
+}}
+.pixiv-title a {{ color: inherit; text-decoration: none; }}
+.pixiv-title a:hover {{ color: var(--primary-color); }}
+.pixiv-author {{ font-size: 0.85rem; color: var(--text-light); margin-bottom: 8px; }}
+.pixiv-author a {{ color: inherit; text-decoration: none; }}
+.pixiv-author a:hover {{ color: var(--primary-color); }}
+.pixiv-stats {{
+    display: flex; justify-content: space-between; gap: 12px; font-size: 0.8rem; color: var(--text-light);
+    margin-top: auto; border-top: 1px solid var(--border-color); padding-top: 8px;
+}}
+ .pixiv-stats span {{ display: inline-flex; align-items: center; gap: 4px; }}
+
+/* 链接样式 (保持不变) */
+a {{ color: var(--text-color); text-decoration: none; transition: var(--transition); }}
+a:hover {{ color: var(--primary-color); text-decoration: underline; }}
+
+/* 动画效果 (保持不变) */
+@keyframes pulse {{
+    0% {{ transform: scale(1); opacity: 1; }}
+    50% {{ transform: scale(1.08); opacity: 0.7; }}
+    100% {{ transform: scale(1); opacity: 1; }}
+}}
+
+/* 响应式设计 (保持不变) */
+@media (max-width: 768px) {{
+    .container {{ padding: 15px; }}
+    h1 {{ font-size: 2rem; }}
+    h2 {{ font-size: 1.4rem; }}
+    .items {{ grid-template-columns: 1fr; gap: 15px; }}
+    .bilibili-item {{ flex-direction: column; }}
+    .bilibili-cover {{ width: 100%; height: auto; aspect-ratio: 16/9; }}
+}}
+ @media (max-width: 480px) {{
+     body {{ padding: 10px 0; }}
+     .container {{ padding: 0 10px; }}
+     h1 {{ font-size: 1.8rem; }}
+     h2 {{ font-size: 1.3rem; }}
+     .section {{ padding: 15px; }}
+     .item {{ padding: 12px; }}
+ }}
+"""
+
+class Markup(str):
+    """已经是安全HTML的字符串, 渲染模板时不再转义"""
+
+class Template:
+    """预编译的HTML模板: 创建时拆分一次, 渲染时只做字段替换 (字段默认转义)"""
+
+    def __init__(self, text: str):
+        self._parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+
+    def render_into(self, out: List[str], fields: Dict) -> None:
+        append = out.append
+        for literal, field in self._parts:
+            append(literal)
+            if field is not None:
+                value = fields[field]
+                append(value if isinstance(value, Markup) else html_escape(str(value)))
+
+    def render(self, fields: Dict) -> str:
+        out = []
+        self.render_into(out, fields)
+        return "".join(out)
+
+@lru_cache(maxsize=None)
+def render_theme_css(theme: str) -> str:
+    """生成某个主题的完整CSS (每个主题只生成一次)"""
+    theme_vars = dict(THEMES.get(theme, THEMES["default"])["vars"])
+    theme_vars["hover-shadow-color"] = theme_vars["primary-light"].replace('0.2', '0.3')  # 悬停阴影加深
+    return CSS_TEMPLATE.format_map(theme_vars)
+
+STYLE_TAG_TEMPLATE = Template("<style>{css}</style>")
+STYLESHEET_LINK_TEMPLATE = Template('<link rel="stylesheet" href="{href}">')
+
+_built_stylesheets = {}
+_built_stylesheets_lock = threading.Lock()
+
+def build_theme_stylesheet(theme: str, css_dir: str) -> str:
+    """把主题CSS写入以内容哈希命名的独立文件 (内容不变时复用已有文件), 返回文件路径"""
+    css = render_theme_css(theme)
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(css_dir, f"theme-{theme}.{digest}.css")
+    with _built_stylesheets_lock:
+        if _built_stylesheets.get(theme) == path:
+            return path
+        if not os.path.exists(path):
+            atomic_write(path, css)
+        _built_stylesheets[theme] = path
+    return path
+
+def build_theme_stylesheets(config: Dict) -> Dict[str, str]:
+    """为所有主题生成样式文件, 返回 主题 -> 文件路径"""
+    css_dir = config.get("css_dir", os.path.join("static", "css"))
+    return {theme: build_theme_stylesheet(theme, css_dir) for theme in THEMES}
+
+def render_stylesheet_tag(theme: str, config: Dict) -> Markup:
+    """生成引用主题样式的标签 (内联 <style> 或指向样式文件的 <link>)"""
+    if config.get("inline_css"):
+        return Markup(STYLE_TAG_TEMPLATE.render({"css": Markup(render_theme_css(theme))}))
+    path = build_theme_stylesheet(theme, config.get("css_dir", os.path.join("static", "css")))
+    output_dir = os.path.dirname(os.path.abspath(config.get("output_file", "daily_news.html")))
+    href = os.path.relpath(os.path.abspath(path), output_dir).replace(os.sep, "/")
+    return Markup(STYLESHEET_LINK_TEMPLATE.render({"href": href}))
+
+PAGE_HEAD_TEMPLATE = Template("""
+<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title} - {theme_name}</title>
+    {stylesheet}
+</head>
+<body>
+    <div class="container">
+        <header>
+            <h1>{title}</h1>
+            <div class="date">{date}</div>
+        </header>
+
+        <main>
+""")
+
+PAGE_FOOT_TEMPLATE = Template("""
+        </main>
+        <footer>
+            <p style="text-align: center; font-size: 0.85rem; color: var(--text-light); margin-top: 40px; padding: 20px 0; border-top: 1px solid var(--border-color);">
+                Generated by Daily News Aggregator | Theme: {theme_name}
+            </p>
+        </footer>
+    </div>
+</body>
+</html>
+""")
+
+SECTION_OPEN_TEMPLATE = Template("""
+        <section class="section {source}-section">
+            <h2><span class="emoji">{emoji}</span> {heading}</h2>
+            <div class="items">
+""")
 
-    # --- HTML生成内容 (修改版) ---
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{config['title']} - {selected_theme['name']}</title>
-        {css}
-    </head>
-    <body>
-        <div class="container">
-            <header>
-                <h1>{config['title']}</h1>
-                <div class="date">{date_str}</div>
-            </header>
-
-            <main>
-    """
+SECTION_CLOSE = """
+            </div>
+        </section>
+"""
 
-    # GitHub部分
-    if config["sources"]["github"] and data.get("github"):
-        chinese_label = " (中文)" if config["github"]["chinese_only"] else ""
-        html += f"""
-        <section class="section github-section">
-            <h2><span class="emoji">💻</span> GitHub 热门项目{chinese_label}</h2>
-            <div class="items">
-        """
-        for project in data["github"]:
-            html += f"""
-            <article class="item github-item">
-                <h3><a href="{project.url}" target="_blank" rel="noopener noreferrer">{project.name}</a></h3>
-                <p>{project.description}</p>
+SECTION_EMPTY_TEMPLATE = Template(
+    """<section class="section {source}-section"><h2><span class="emoji">{emoji}</span> {heading}</h2><p>{message}</p></section>"""
+)
+
+GITHUB_ITEM_TEMPLATE = Template("""
+            <article class="item github-item{status_class}">
+                <h3>{badge}<a href="{url}" target="_blank" rel="noopener noreferrer">{name}</a></h3>
+                <p>{description}</p>
                 <div class="meta">
-                    <span class="language">{project.language or 'N/A'}</span>
+                    <span class="language">{language}</span>
                     <div class="stats">
-                        <span>⭐ {format_number(project.stars)}</span>
-                        <span>🍴 {format_number(project.forks)}</span>
+                        <span>⭐ {stars}</span>
+                        <span>🍴 {forks}</span>
                     </div>
                 </div>
             </article>
-            """
-        html += """
-            </div>
-        </section>
-        """
-    elif config["sources"]["github"]:
-        html += f"""<section class="section github-section"><h2><span class="emoji">💻</span> GitHub 热门项目{chinese_label}</h2><p>未能加载GitHub数据。</p></section>"""
-
-
-    # B站部分
-    if config["sources"]["bilibili"] and data.get("bilibili"):
-        html += f"""
-        <section class="section bilibili-section">
-            <h2><span class="emoji">📺</span> 哔哩哔哩 热门视频</h2>
-            <div class="items">
-        """
-        for video in data["bilibili"]:
-            cover_url = video.cover.replace("http://", "https://") if video.cover else ""
+""")
 
-            html += f"""
-            <article class="item bilibili-item">
-                <a href="{video.url}" target="_blank" rel="noopener noreferrer" class="bilibili-cover-link">
-                    <img src="{cover_url}" class="bilibili-cover" alt="封面" loading="lazy">
+BILIBILI_ITEM_TEMPLATE = Template("""
+            <article class="item bilibili-item{status_class}">
+                <a href="{url}" target="_blank" rel="noopener noreferrer" class="bilibili-cover-link">
+                    <img src="{cover}" class="bilibili-cover" alt="封面" loading="lazy">
                 </a>
                 <div class="bilibili-info">
-                    <h3><a href="{video.url}" target="_blank" rel="noopener noreferrer">{video.title}</a></h3>
+                    <h3>{badge}<a href="{url}" target="_blank" rel="noopener noreferrer">{title}</a></h3>
                     <div class="up-name">
-                        👨‍🎨 <a href="{video.up_url}" target="_blank" rel="noopener noreferrer">{video.up_name}</a>
+                        👨‍🎨 <a href="{up_url}" target="_blank" rel="noopener noreferrer">{up_name}</a>
                     </div>
                     <div class="bilibili-stats">
-                        <span>▶️ {video.views}</span>
-                        <span>💬 {video.danmaku}</span>
-                        <span>📅 {video.published_date}</span>
+                        <span>▶️ {views}</span>
+                        <span>💬 {danmaku}</span>
+                        <span>📅 {published_date}</span>
                     </div>
                 </div>
             </article>
-            """
-        html += """
-            </div>
-        </section>
-        """
-    elif config["sources"]["bilibili"]:
-        html += f"""<section class="section bilibili-section"><h2><span class="emoji">📺</span> 哔哩哔哩 热门视频</h2><p>未能加载B站数据。</p></section>"""
-
-    # 微博部分 (修改HTML结构)
-    # === 修改微博部分 ===
-    if config["sources"]["weibo"] and data.get("weibo"):
-        html += f"""
-        <section class="section weibo-section">
-            <h2><span class="emoji">🔥</span> 微博热搜榜</h2>
-            <div class="items">
-        """
-        for hot in data["weibo"]:
-            label_class = {"爆": "boom", "热": "hot", "新": "new", "沸": "boil", "荐": "recommend"}.get(hot.label, "")
-            label_html = f'<span class="weibo-label {label_class}">{hot.label}</span>' if label_class else ''
+""")
 
-            html += f"""
-            <article class="item zhihu-item">  <!-- 使用知乎的样式 -->
-                <h3><a href="{hot.url}" target="_blank" rel="noopener noreferrer" title="{hot.title}">{hot.title}</a></h3>
+WEIBO_ITEM_TEMPLATE = Template("""
+            <article class="item zhihu-item{status_class}">  <!-- 使用知乎的样式 -->
+                <h3>{badge}<a href="{url}" target="_blank" rel="noopener noreferrer" title="{title}">{title}</a></h3>
                 <div class="zhihu-meta">
                     <div class="zhihu-stats">
                         {label_html}
                     </div>
-                    <div class="weibo-hot">{hot.hot_score}</div>
+                    <div class="weibo-hot">{hot_score}</div>
                 </div>
             </article>
-            """
-        html += """
-            </div>
-        </section>
-        """
-    elif config["sources"]["weibo"]:
-        html += f"""<section class="section weibo-section"><h2><span class="emoji">🔥</span> 微博热搜榜</h2><p>未能加载微博数据。</p></section>"""
+""")
 
+WEIBO_LABEL_TEMPLATE = Template('<span class="weibo-label {label_class}">{label}</span>')
+WEIBO_LABEL_CLASSES = {"爆": "boom", "热": "hot", "新": "new", "沸": "boil", "荐": "recommend"}
 
-    # 知乎部分
-    if config["sources"]["zhihu"] and data.get("zhihu"):
-        html += f"""
-        <section class="section zhihu-section">
-            <h2><span class="emoji">💡</span> 知乎热榜</h2>
-            <div class="items">
-        """
-        for question in data["zhihu"]:
-            html += f"""
-            <article class="item zhihu-item">
-                <h3><a href="{question.url}" target="_blank" rel="noopener noreferrer" title="{question.title}">{question.title}</a></h3>
+# 与上次运行相比的变化标记 (unchanged 不显示)
+ITEM_BADGE_TEMPLATE = Template('<span class="item-badge {status}">{label}</span>')
+ITEM_BADGE_LABELS = {"new": "新", "rising": "↑", "falling": "↓"}
+
+ZHIHU_ITEM_TEMPLATE = Template("""
+            <article class="item zhihu-item{status_class}">
+                <h3>{badge}<a href="{url}" target="_blank" rel="noopener noreferrer" title="{title}">{title}</a></h3>
                 <div class="zhihu-meta">
                     <div class="zhihu-stats">
-                        <span>💬 {format_number(question.answer_count)} 回答</span>
-                        <span>👀 {format_number(question.follower_count)} 关注</span>
+                        <span>💬 {answer_count} 回答</span>
+                        <span>👀 {follower_count} 关注</span>
                     </div>
-                    <div class="zhihu-hot">{question.hot_score}</div>
+                    <div class="zhihu-hot">{hot_score}</div>
                 </div>
             </article>
-            """
-        html += """
-            </div>
-        </section>
-        """
-    elif config["sources"]["zhihu"]:
-        html += f"""<section class="section zhihu-section"><h2><span class="emoji">💡</span> 知乎热榜</h2><p>未能加载知乎数据。</p></section>"""
-
-    # === 修改Pixiv部分 ===
-    if config["sources"]["pixiv"] and data.get("pixiv"):
-        html += f"""
-        <section class="section pixiv-section">
-            <h2><span class="emoji">🎨</span> Pixiv 排行榜</h2>
-            <div class="items">
-        """
-        for artwork in data["pixiv"]:
-            html += f"""
-            <article class="item pixiv-item">
-                <a href="{artwork.url}" target="_blank" rel="noopener noreferrer" class="pixiv-image-link">
+""")
+
+PIXIV_ITEM_TEMPLATE = Template("""
+            <article class="item pixiv-item{status_class}">
+                <a href="{url}" target="_blank" rel="noopener noreferrer" class="pixiv-image-link">
                     <div class="pixiv-image-container">
-                        <img src="{artwork.image_url}" class="pixiv-image" alt="{artwork.title}" loading="lazy">
+                        <picture>{sources}<img src="{image_url}"{srcset} class="pixiv-image" alt="{title}" loading="lazy"></picture>
                     </div>
                 </a>
                 <div class="pixiv-info">
-                    <h3 class="pixiv-title">{artwork.title}</h3>
-                    <div class="pixiv-author">🎨 {artwork.author}</div>
+                    <h3 class="pixiv-title">{badge}{title}</h3>
+                    <div class="pixiv-author">🎨 {author}</div>
                     <div class="pixiv-stats">
-                        <span>❤️ {format_number(artwork.bookmarks)}</span>
-                        <span style="margin-left: auto;">{artwork.width}×{artwork.height}</span>
+                        <span>❤️ {bookmarks}</span>
+                        <span style="margin-left: auto;">{width}×{height}</span>
                     </div>
                 </div>
             </article>
-            """
-        html += """
-            </div>
-        </section>
-        """
-    elif config["sources"]["pixiv"]:
-        html += f"""<section class="section pixiv-section"><h2><span class="emoji">🎨</span> Pixiv 排行榜</h2><p>未能加载Pixiv数据。</p></section>"""
-
-
-    html += """
-            </main>
-            <footer>
-                <p style="text-align: center; font-size: 0.85rem; color: var(--text-light); margin-top: 40px; padding: 20px 0; border-top: 1px solid var(--border-color);">
-                    Generated by Daily News Aggregator | Theme: {selected_theme['name']}
-                </p>
-            </footer>
-        </div>
-    </body>
-    </html>
+""")
+
+def _github_fields(project: GithubProject) -> Dict:
+    return {
+        "url": project.url, "name": project.name, "description": project.description,
+        "language": project.language or 'N/A',
+        "stars": format_number(project.stars), "forks": format_number(project.forks)
+    }
+
+def _bilibili_fields(video: BilibiliVideo) -> Dict:
+    return {
+        "url": video.url, "title": video.title,
+        "cover": video.cover.replace("http://", "https://") if video.cover else "",
+        "up_url": video.up_url, "up_name": video.up_name,
+        "views": video.views, "danmaku": video.danmaku, "published_date": video.published_date
+    }
+
+def _weibo_fields(hot: WeiboHot) -> Dict:
+    label_class = WEIBO_LABEL_CLASSES.get(hot.label, "")
+    label_html = WEIBO_LABEL_TEMPLATE.render({"label_class": label_class, "label": hot.label}) if label_class else ""
+    return {"url": hot.url, "title": hot.title, "label_html": Markup(label_html), "hot_score": hot.hot_score}
+
+def _zhihu_fields(question: ZhihuQuestion) -> Dict:
+    return {
+        "url": question.url, "title": question.title, "hot_score": question.hot_score,
+        "answer_count": format_number(question.answer_count),
+        "follower_count": format_number(question.follower_count)
+    }
+
+PIXIV_SOURCE_TEMPLATE = Template('<source type="image/{fmt}" srcset="{srcset}" sizes="{sizes}">')
+PIXIV_SRCSET_TEMPLATE = Template(' srcset="{srcset}" sizes="{sizes}"')
+PIXIV_IMAGE_SIZES = "(max-width: 768px) 100vw, 400px"
+
+def _pixiv_image_fields(artwork: PixivArtwork) -> Dict:
+    """有缩略图时用 <source> 提供 AVIF/WebP, <img> 使用 JPEG 缩略图兜底; 否则直接使用原图"""
+    thumbnails = artwork.thumbnails
+    if not thumbnails or "jpeg" not in thumbnails:
+        return {"image_url": artwork.image_url, "sources": Markup(""), "srcset": Markup("")}
+
+    def srcset(entries):
+        return ", ".join(f"{path.replace(os.sep, '/')} {width}w" for width, path in entries)
+    sources = "".join(
+        PIXIV_SOURCE_TEMPLATE.render({"fmt": fmt, "srcset": srcset(thumbnails[fmt]), "sizes": PIXIV_IMAGE_SIZES})
+        for fmt in ("avif", "webp") if fmt in thumbnails
+    )
+    return {
+        "image_url": thumbnails["jpeg"][0][1].replace(os.sep, "/"),
+        "sources": Markup(sources),
+        "srcset": Markup(PIXIV_SRCSET_TEMPLATE.render({"srcset": srcset(thumbnails["jpeg"]), "sizes": PIXIV_IMAGE_SIZES}))
+    }
+
+def _pixiv_fields(artwork: PixivArtwork) -> Dict:
+    return {
+        **_pixiv_image_fields(artwork), "url": artwork.url, "title": artwork.title,
+        "author": artwork.author, "bookmarks": format_number(artwork.bookmarks),
+        "width": artwork.width, "height": artwork.height
+    }
+
+# 数据源名称 -> (emoji, 标题, 条目模板, 字段生成函数, 加载失败提示)
+SECTION_RENDERERS = {
+    "github": ("💻", "GitHub 热门项目", GITHUB_ITEM_TEMPLATE, _github_fields, "未能加载GitHub数据。"),
+    "bilibili": ("📺", "哔哩哔哩 热门视频", BILIBILI_ITEM_TEMPLATE, _bilibili_fields, "未能加载B站数据。"),
+    "weibo": ("🔥", "微博热搜榜", WEIBO_ITEM_TEMPLATE, _weibo_fields, "未能加载微博数据。"),
+    "zhihu": ("💡", "知乎热榜", ZHIHU_ITEM_TEMPLATE, _zhihu_fields, "未能加载知乎数据。"),
+    "pixiv": ("🎨", "Pixiv 排行榜", PIXIV_ITEM_TEMPLATE, _pixiv_fields, "未能加载Pixiv数据。"),
+}
+
+def _status_fields(status: Optional[str]) -> Dict:
+    label = ITEM_BADGE_LABELS.get(status)
+    if not label:
+        return {"status_class": "", "badge": Markup("")}
+    return {
+        "status_class": f" item-{status}",
+        "badge": Markup(ITEM_BADGE_TEMPLATE.render({"status": status, "label": label}))
+    }
+
+def render_section_into(out: List[str], source: str, items: List, config: Dict,
+                        statuses: List[str] = None) -> None:
+    """渲染某个数据源的区块 (statuses 为与 items 对应的变化标记, 可省略)"""
+    emoji, heading, item_template, make_fields, empty_message = SECTION_RENDERERS[source]
+    if source == "github" and config["github"]["chinese_only"]:
+        heading += " (中文)"
+    section_fields = {"source": source, "emoji": emoji, "heading": heading}
+    if not items:
+        SECTION_EMPTY_TEMPLATE.render_into(out, dict(section_fields, message=empty_message))
+        return
+    SECTION_OPEN_TEMPLATE.render_into(out, section_fields)
+    statuses = statuses or []
+    for index, item in enumerate(items):
+        fields = make_fields(item)
+        fields.update(_status_fields(statuses[index] if index < len(statuses) else None))
+        item_template.render_into(out, fields)
+    out.append(SECTION_CLOSE)
+
+# --- 区块缓存 ---
+# 模板本身变化时 (例如升级代码后) 让所有缓存的区块失效
+TEMPLATE_DIGEST = hashlib.sha256(repr([
+    template._parts for template in
+    [SECTION_OPEN_TEMPLATE, SECTION_EMPTY_TEMPLATE, WEIBO_LABEL_TEMPLATE, ITEM_BADGE_TEMPLATE,
+     PIXIV_SOURCE_TEMPLATE, PIXIV_SRCSET_TEMPLATE]
+    + [renderer[2] for renderer in SECTION_RENDERERS.values()]
+] + [SECTION_CLOSE]).encode("utf-8")).hexdigest()
+
+def section_digest(source: str, items: List, config: Dict, statuses: List[str] = None) -> str:
+    """计算区块内容的哈希 (数据、变化标记、标题相关配置和模板都参与计算)"""
+    key = (TEMPLATE_DIGEST, source, config["github"]["chinese_only"] if source == "github" else None,
+           items, statuses or [])
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+class FragmentCache:
+    """按数据源缓存渲染好的HTML区块 (内存 + 磁盘), 数据哈希不变时直接复用"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._memory = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, source: str) -> str:
+        return os.path.join(self.directory, f"{source}.json")
+
+    def get(self, source: str, digest: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(source)
+        if entry is None:
+            try:
+                with open(self._path(source), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            with self._lock:
+                self._memory[source] = entry
+        return entry["html"] if entry.get("digest") == digest else None
+
+    def put(self, source: str, digest: str, fragment: str) -> None:
+        entry = {"digest": digest, "html": fragment}
+        with self._lock:
+            self._memory[source] = entry
+        try:
+            atomic_write(self._path(source), json.dumps(entry, ensure_ascii=False))
+        except OSError as e:
+            print(f"保存HTML区块缓存失败 {source}: {e}")
+
+_fragment_cache = None
+_fragment_cache_lock = threading.Lock()
+
+def get_fragment_cache() -> Optional[FragmentCache]:
+    """获取共享的HTML区块缓存 (配置中禁用时返回 None)"""
+    global _fragment_cache
+    cache_config = CONFIG.get("fragment_cache", {})
+    if not cache_config.get("enabled"):
+        return None
+    if _fragment_cache is None:
+        with _fragment_cache_lock:
+            if _fragment_cache is None:
+                _fragment_cache = FragmentCache(cache_config.get("dir", os.path.join(".cache", "fragments")))
+    return _fragment_cache
+
+def render_section_cached(source: str, items: List, config: Dict, statuses: List[str] = None) -> str:
+    """渲染区块, 数据未变化时复用缓存的HTML"""
+    cache = get_fragment_cache()
+    if cache is None:
+        out = []
+        render_section_into(out, source, items, config, statuses)
+        return "".join(out)
+    digest = section_digest(source, items, config, statuses)
+    fragment = cache.get(source, digest)
+    if fragment is None:
+        out = []
+        render_section_into(out, source, items, config, statuses)
+        fragment = "".join(out)
+        cache.put(source, digest, fragment)
+    return fragment
+
+def render_page_into(out: List[str], data: Dict[str, List], config: Dict,
+                     statuses: Dict[str, List[str]] = None) -> None:
+    """将整个页面渲染到 out 列表中"""
+    statuses = statuses or {}
+    theme = config.get("theme", "default")
+    selected_theme = THEMES.get(theme, THEMES["default"])
+    page_fields = {
+        "title": config['title'],
+        "theme_name": selected_theme['name'],
+        "date": datetime.now().strftime("%Y年%m月%d日"),  # 使用你文件中的日期格式
+        "stylesheet": render_stylesheet_tag(theme, config)
+    }
+    PAGE_HEAD_TEMPLATE.render_into(out, page_fields)
+    for source in SECTION_RENDERERS:
+        if config["sources"].get(source):
+            out.append(render_section_cached(source, data.get(source), config, statuses.get(source)))
+    PAGE_FOOT_TEMPLATE.render_into(out, page_fields)
+
+def generate_html(data: Dict[str, List], config: Dict, statuses: Dict[str, List[str]] = None) -> str:
+    """生成HTML报告 (statuses 为各数据源条目的变化标记, 见 SeenIndex)"""
+    out = []
+    render_page_into(out, data, config, statuses)
+    return "".join(out)
+
+def write_if_changed(path: str, content: str) -> bool:
+    """内容与现有文件不同时才 (原子地) 写入, 返回是否写入"""
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest():
+                return False
+    except OSError:
+        pass
+    atomic_write(path, data)
+    return True
+
+# =============== 数据快照缓存 ===============
+class SnapshotCache:
+    """按数据源及其参数保存最近一次成功获取的结果 (stale-while-revalidate)"""
+
+    def __init__(self, directory: str, ttl: Dict[str, float], default_ttl: float = 600):
+        self.directory = directory
+        self.ttl = ttl
+        self.default_ttl = default_ttl
+        self._memory = {}
+        self._refreshing = {}
+        self._refreshed = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(source: str, params: Dict) -> str:
+        return f"{source}:{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pkl")
+
+    def load(self, key: str) -> Optional[Tuple[float, List]]:
+        """读取快照, 返回 (获取时间戳, 数据) 或 None"""
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+        try:
+            with open(self._path(key), "rb") as f:
+                snapshot = pickle.load(f)
+        except Exception:
+            return None
+        with self._lock:
+            self._memory[key] = snapshot
+        return snapshot
+
+    def save(self, key: str, items: List) -> None:
+        snapshot = (time.time(), items)
+        with self._lock:
+            self._memory[key] = snapshot
+        try:
+            atomic_write(self._path(key), pickle.dumps(snapshot))
+        except (OSError, pickle.PicklingError) as e:
+            print(f"保存数据快照失败 {key}: {e}")
+
+    def get(self, source: str, params: Dict, fetch: Callable[[], List]) -> Tuple[List, bool]:
+        """返回 (数据源的数据, 是否来自快照): 快照未过期直接返回; 已过期先返回旧数据并后台刷新; 没有快照则同步获取"""
+        key = self.make_key(source, params)
+        snapshot = self.load(key)
+        if snapshot is None:
+            return self._refresh(key, fetch), False
+        fetched_at, items = snapshot
+        age = time.time() - fetched_at
+        if age > self.ttl.get(source, self.default_ttl):
+            print(f"   > {source} 快照已过期 ({age:.0f}s), 先使用旧数据并在后台刷新")
+            self._refresh_in_background(source, key, fetch)
+        return items, True
+
+    def _refresh(self, key: str, fetch: Callable[[], List]) -> List:
+        items = fetch()
+        if items:  # 获取失败时保留上一次的快照
+            self.save(key, items)
+        return items
+
+    def _refresh_in_background(self, source: str, key: str, fetch: Callable[[], List]) -> None:
+        with self._lock:
+            thread = self._refreshing.get(key)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._background_refresh, args=(source, key, fetch),
+                                      name=f"refresh-{key}")
+            self._refreshing[key] = thread
+        thread.start()
+
+    def _background_refresh(self, source: str, key: str, fetch: Callable[[], List]) -> None:
+        items = self._refresh(key, fetch)
+        if items:
+            with self._lock:
+                self._refreshed[source] = items
+
+    def wait(self, timeout: float = None) -> Dict[str, List]:
+        """等待所有后台刷新完成, 返回上次调用以来后台刷新得到的数据 (数据源 -> 条目)"""
+        with self._lock:
+            threads = list(self._refreshing.values())
+        for thread in threads:
+            thread.join(timeout)
+        with self._lock:
+            refreshed, self._refreshed = self._refreshed, {}
+        return refreshed
+
+_snapshot_cache = None
+_snapshot_cache_lock = threading.Lock()
+
+def get_snapshot_cache() -> Optional[SnapshotCache]:
+    """获取共享的数据快照缓存 (配置中禁用时返回 None)"""
+    global _snapshot_cache
+    cache_config = CONFIG.get("snapshot_cache", {})
+    if not cache_config.get("enabled"):
+        return None
+    if _snapshot_cache is None:
+        with _snapshot_cache_lock:
+            if _snapshot_cache is None:
+                _snapshot_cache = SnapshotCache(
+                    cache_config.get("dir", os.path.join(".cache", "snapshots")),
+                    cache_config.get("ttl", {}),
+                    cache_config.get("default_ttl", 600)
+                )
+    return _snapshot_cache
+
+# =============== 条目标识 ===============
+def _url_path_tail(url: str, marker: str) -> str:
+    """取 URL 路径中 marker 之后的一段, 例如 /video/BVxxx 中的 BVxxx"""
+    path = urlsplit(url or "").path
+    index = path.find(marker)
+    if index < 0:
+        return ""
+    return path[index + len(marker):].split("/", 1)[0]
+
+# 数据源名称 -> 从条目中取稳定标识的函数 (仓库名、bvid、热搜词、问题ID、作品ID)
+ITEM_KEY_FUNCTIONS = {
+    "github": lambda item: item.name,
+    "bilibili": lambda item: _url_path_tail(item.url, "/video/") or item.url,
+    "weibo": lambda item: item.title,
+    "zhihu": lambda item: _url_path_tail(item.url, "/question/") or item.url,
+    "pixiv": lambda item: _url_path_tail(item.url, "/artworks/") or item.url
+}
+
+def item_key(source: str, item) -> str:
+    """条目在各次运行之间保持不变的标识"""
+    return ITEM_KEY_FUNCTIONS[source](item)
+
+# =============== 历史归档 ===============
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    sources TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    title TEXT,
+    url TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    UNIQUE (source, item_key)
+);
+CREATE TABLE IF NOT EXISTS observations (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    item_id INTEGER NOT NULL REFERENCES items (id),
+    source TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    rank INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs (started_at);
+CREATE INDEX IF NOT EXISTS idx_items_last_seen ON items (source, last_seen);
+CREATE INDEX IF NOT EXISTS idx_observations_item_time ON observations (item_id, fetched_at);
+CREATE INDEX IF NOT EXISTS idx_observations_source_time ON observations (source, fetched_at);
+CREATE INDEX IF NOT EXISTS idx_observations_run ON observations (run_id);
+"""
+
+class RunArchive:
+    """把每次运行获取到的条目按数据源写入 SQLite
+
+    items 表每个条目一行 (按数据源和稳定标识去重), observations 表记录每次运行中条目的排名和完整数据。
     """
 
-    return html
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(ARCHIVE_SCHEMA)
+
+    def record_run(self, data: Dict[str, List], started_at: float = None) -> int:
+        """在一个事务中批量写入本次运行各数据源的条目, 返回运行ID"""
+        started_at = started_at or time.time()
+        sources = [source for source, items in data.items() if items]
+        item_rows = []
+        observation_rows = []
+        for source in sources:
+            for rank, item in enumerate(data[source], 1):
+                key = item_key(source, item)
+                item_rows.append((source, key, getattr(item, "title", None) or getattr(item, "name", ""),
+                                  item.url, started_at, started_at))
+                observation_rows.append((source, started_at, rank,
+                                         json.dumps(asdict(item), ensure_ascii=False), source, key))
+        with self._lock, self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (started_at, sources) VALUES (?, ?)", (started_at, ",".join(sources))
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO items (source, item_key, title, url, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (source, item_key) DO UPDATE SET "
+                "title = excluded.title, url = excluded.url, last_seen = excluded.last_seen",
+                item_rows
+            )
+            self.conn.executemany(
+                "INSERT INTO observations (run_id, item_id, source, fetched_at, rank, data) "
+                "SELECT ?, id, ?, ?, ?, ? FROM items WHERE source = ? AND item_key = ?",
+                [(run_id, *row) for row in observation_rows]
+            )
+        return run_id
+
+    def rank_history(self, source: str, key: str, since: float = 0) -> List[Tuple[float, int]]:
+        """某个条目自 since 以来每次被抓取到时的 (时间, 排名)"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT o.fetched_at, o.rank FROM observations o JOIN items i ON i.id = o.item_id "
+                "WHERE i.source = ? AND i.item_key = ? AND o.fetched_at >= ? ORDER BY o.fetched_at",
+                (source, key, since)
+            ).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+_run_archive = None
+_run_archive_lock = threading.Lock()
+
+def get_run_archive() -> Optional[RunArchive]:
+    """获取共享的历史归档 (配置中禁用时返回 None)"""
+    global _run_archive
+    archive_config = CONFIG.get("archive", {})
+    if not archive_config.get("enabled"):
+        return None
+    if _run_archive is None:
+        with _run_archive_lock:
+            if _run_archive is None:
+                _run_archive = RunArchive(archive_config.get("path", os.path.join("data", "archive.sqlite3")))
+    return _run_archive
+
+def archive_run(data: Dict[str, List], metrics: RunMetrics) -> None:
+    """把本次运行的数据写入历史归档 (失败不影响页面生成)"""
+    archive = get_run_archive()
+    if archive is None or not any(data.values()):  # 没有新数据时不记录空的运行
+        return
+    try:
+        with metrics.stage("archive"):
+            archive.record_run(data)
+    except sqlite3.Error as e:
+        print(f"写入历史归档失败: {e}")
+
+# =============== 新条目标记 ===============
+class SeenIndex:
+    """按数据源记录见过的条目及其上次的排名和时间, 把本次的条目标记为 new/rising/falling/unchanged
+
+    条目标识压缩成 8 字节哈希作为字典的键, 每个条目的判断都是 O(1);
+    超过保留期未再出现的条目在保存时清除, 索引大小只与保留期内出现过的条目数有关。
+    最近一次更新得到的标记另存一份, 数据来自快照缓存 (没有重新获取) 时沿用这些标记。
+    """
 
-# =============== 主函数 ===============
-# (主函数保持不变 - 来源于你提供的文件)
-def main():
-    data = {}
+    def __init__(self, directory: str, expiry: float):
+        self.directory = directory
+        self.expiry = expiry
+        self._memory = {}
+        self._last = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
 
-    print("开始获取数据...") # 添加打印信息
+    def _path(self, source: str) -> str:
+        return os.path.join(self.directory, f"{source}.json")
 
-    # 根据配置获取数据
-    if CONFIG["sources"]["github"]:
-        print(" - 获取 GitHub 数据...") # 添加打印信息
-        data["github"] = fetch_github_trending(
-            limit=CONFIG["github"]["limit"],
-            chinese_only=CONFIG["github"]["chinese_only"]
-        )
-        print(f"   > 获取到 {len(data.get('github', []))} 条 GitHub 数据") # 添加打印信息
+    def _last_path(self, source: str) -> str:
+        return os.path.join(self.directory, f"{source}.last.json")
 
-    if CONFIG["sources"]["bilibili"]:
-        print(" - 获取 Bilibili 数据...") # 添加打印信息
-        data["bilibili"] = fetch_bilibili_hot(
-            limit=CONFIG["bilibili"]["limit"],
-            region=CONFIG["bilibili"]["region"]
-        )
-        print(f"   > 获取到 {len(data.get('bilibili', []))} 条 Bilibili 数据") # 添加打印信息
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
 
-    if CONFIG["sources"]["weibo"]:
-        print(" - 获取 Weibo 数据...") # 添加打印信息
-        data["weibo"] = fetch_weibo_hot(
-            limit=CONFIG["weibo"]["limit"],
-            category=CONFIG["weibo"]["category"]
-        )
-        print(f"   > 获取到 {len(data.get('weibo', []))} 条 Weibo 数据") # 添加打印信息
+    def _load(self, source: str) -> Dict[str, List]:
+        entries = self._memory.get(source)
+        if entries is None:
+            try:
+                with open(self._path(source), encoding="utf-8") as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                entries = {}
+            self._memory[source] = entries
+        return entries
+
+    def update(self, source: str, items: List) -> List[str]:
+        """与记录比较得到每个条目的变化标记, 然后把本次的排名写回索引"""
+        now = time.time()
+        cutoff = now - self.expiry
+        statuses = []
+        with self._lock:
+            entries = self._load(source)
+            seen = {}
+            last = {}
+            for rank, item in enumerate(items, 1):
+                digest = self._hash(item_key(source, item))
+                previous = entries.get(digest)
+                if previous is None or previous[1] < cutoff:
+                    status = "new"
+                elif rank < previous[0]:
+                    status = "rising"
+                elif rank > previous[0]:
+                    status = "falling"
+                else:
+                    status = "unchanged"
+                statuses.append(status)
+                seen.setdefault(digest, [rank, int(now)])
+                last.setdefault(digest, status)
+            entries.update(seen)
+            for digest in [digest for digest, (_, last_seen) in entries.items() if last_seen < cutoff]:
+                del entries[digest]
+            self._last[source] = last
+            try:
+                atomic_write(self._path(source), json.dumps(entries, separators=(",", ":")))
+                atomic_write(self._last_path(source), json.dumps(last, separators=(",", ":")))
+            except OSError as e:
+                print(f"保存新条目索引失败 {source}: {e}")
+        return statuses
+
+    def last_statuses(self, source: str, items: List) -> List[str]:
+        """不更新索引, 返回最近一次更新时这些条目的标记 (当时没有的条目为 unchanged)"""
+        with self._lock:
+            last = self._last.get(source)
+            if last is None:
+                try:
+                    with open(self._last_path(source), encoding="utf-8") as f:
+                        last = json.load(f)
+                except (OSError, ValueError):
+                    last = {}
+                self._last[source] = last
+        return [last.get(self._hash(item_key(source, item)), "unchanged") for item in items]
+
+_seen_index = None
+_seen_index_lock = threading.Lock()
+
+def get_seen_index() -> Optional[SeenIndex]:
+    """获取共享的新条目索引 (配置中禁用时返回 None)"""
+    global _seen_index
+    index_config = CONFIG.get("seen_index", {})
+    if not index_config.get("enabled"):
+        return None
+    if _seen_index is None:
+        with _seen_index_lock:
+            if _seen_index is None:
+                _seen_index = SeenIndex(
+                    index_config.get("dir", os.path.join(".cache", "seen")),
+                    index_config.get("expiry_days", 7) * 86400
+                )
+    return _seen_index
+
+def mark_item_statuses(data: Dict[str, List], metrics: RunMetrics,
+                       cached: Set[str] = frozenset()) -> Dict[str, List[str]]:
+    """为各数据源的条目生成变化标记, 返回 数据源 -> 标记列表
+
+    cached 中的数据源来自快照缓存 (没有重新获取), 不更新索引, 沿用获取它们的那次运行的标记。
+    """
+    index = get_seen_index()
+    if index is None:
+        return {}
+    statuses = {}
+    with metrics.stage("seen_index"):
+        for source, items in data.items():
+            if not items:
+                continue
+            if source in cached:
+                statuses[source] = index.last_statuses(source, items)
+            else:
+                statuses[source] = index.update(source, items)
+                metrics.incr(f"items_new.{source}", statuses[source].count("new"))
+    return statuses
+
+# =============== 订阅源输出 ===============
+# 数据源名称 -> 生成条目摘要的函数
+FEED_SUMMARY_FUNCTIONS = {
+    "github": lambda p: f"{p.description} (⭐ {format_number(p.stars)}, {p.language or 'N/A'})",
+    "bilibili": lambda v: f"UP主: {v.up_name} | ▶️ {v.views} | 💬 {v.danmaku} | {v.published_date}",
+    "weibo": lambda h: f"🔥 {h.hot_score}" + (f" [{h.label}]" if h.label else ""),
+    "zhihu": lambda q: f"{q.hot_score} | {format_number(q.answer_count)} 回答 | {format_number(q.follower_count)} 关注",
+    "pixiv": lambda a: f"🎨 {a.author} | ❤️ {format_number(a.bookmarks)} | {a.width}×{a.height}"
+}
 
-    if CONFIG["sources"]["zhihu"]:
-        print(" - 获取 Zhihu 数据...") # 添加打印信息
-        data["zhihu"] = fetch_zhihu_hot(
-            limit=CONFIG["zhihu"]["limit"],
-            category=CONFIG["zhihu"]["category"]
-        )
-        print(f"   > 获取到 {len(data.get('zhihu', []))} 条 Zhihu 数据") # 添加打印信息
+_XML_INVALID_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+RSS_HEAD_TEMPLATE = Template("""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0">
+<channel>
+<title>{title}</title>
+<link>{link}</link>
+<description>{title}</description>
+<lastBuildDate>{updated}</lastBuildDate>
+""")
+
+RSS_ITEM_TEMPLATE = Template("""<item>
+<title>{title}</title>
+<link>{link}</link>
+<guid isPermaLink="false">{guid}</guid>
+<pubDate>{published}</pubDate>
+<category>{category}</category>
+<description>{summary}</description>
+</item>
+""")
+
+RSS_FOOT = "</channel>\n</rss>\n"
+
+ATOM_HEAD_TEMPLATE = Template("""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+<id>{id}</id>
+<title>{title}</title>
+<link href="{link}"/>
+<updated>{updated}</updated>
+<author><name>{title}</name></author>
+""")
+
+ATOM_ENTRY_TEMPLATE = Template("""<entry>
+<id>{guid}</id>
+<title>{title}</title>
+<link href="{link}"/>
+<updated>{published}</updated>
+<category term="{category}"/>
+<summary>{summary}</summary>
+</entry>
+""")
+
+ATOM_FOOT = "</feed>\n"
+
+def feed_guid(source: str, item) -> str:
+    """条目的稳定GUID (由数据源和条目标识决定, 与排名和抓取时间无关)"""
+    return f"urn:sora-rss:{source}:{hashlib.sha1(item_key(source, item).encode('utf-8')).hexdigest()}"
+
+def feed_entries(source: str, items: List, published: float) -> List[Dict]:
+    """把条目转换成订阅源条目 (保存到状态文件中的字典)"""
+    label = SOURCE_FETCHERS[source][0]
+    summarize = FEED_SUMMARY_FUNCTIONS[source]
+    return [{
+        "guid": feed_guid(source, item),
+        "title": _XML_INVALID_CHARS.sub("", getattr(item, "title", None) or getattr(item, "name", "")),
+        "link": item.url,
+        "summary": _XML_INVALID_CHARS.sub("", summarize(item)).strip(),
+        "category": label,
+        "published": published
+    } for item in items]
+
+def write_rss(path: str, title: str, link: str, entries: List[Dict], updated: float) -> None:
+    """逐条写出 RSS 2.0 文件 (原子替换)"""
+    def rfc822(timestamp: float) -> str:
+        return format_datetime(datetime.fromtimestamp(timestamp, timezone.utc))
+    with atomic_open(path, "w") as f:
+        f.write(RSS_HEAD_TEMPLATE.render({"title": title, "link": link, "updated": rfc822(updated)}))
+        for entry in entries:
+            f.write(RSS_ITEM_TEMPLATE.render(dict(entry, published=rfc822(entry["published"]))))
+        f.write(RSS_FOOT)
+
+def write_atom(path: str, name: str, title: str, link: str, entries: List[Dict], updated: float) -> None:
+    """逐条写出 Atom 文件 (原子替换)"""
+    def rfc3339(timestamp: float) -> str:
+        return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+    with atomic_open(path, "w") as f:
+        f.write(ATOM_HEAD_TEMPLATE.render({"id": f"urn:sora-rss:feed:{name}", "title": title,
+                                           "link": link, "updated": rfc3339(updated)}))
+        for entry in entries:
+            f.write(ATOM_ENTRY_TEMPLATE.render(dict(entry, published=rfc3339(entry["published"]))))
+        f.write(ATOM_FOOT)
+
+def feed_site_link(config: Dict) -> str:
+    """订阅源的频道链接 (必须是绝对地址): 配置的 site_url, 否则为内置服务器上的页面或输出文件的 file: 地址"""
+    site_url = config.get("feeds", {}).get("site_url")
+    if site_url:
+        parts = urlsplit(site_url)
+        if not (parts.scheme and parts.netloc):
+            raise ValueError(f"feeds.site_url 必须是绝对地址: {site_url}")
+        return site_url
+    site = get_live_site()
+    if site is not None:
+        host = site.options.get("host", "127.0.0.1")
+        if host in ("", "0.0.0.0", "::"):  # 监听所有地址时使用本机名
+            host = socket.getfqdn()
+        if ":" in host:
+            host = f"[{host}]"
+        return f"http://{host}:{site.options.get('port', 8080)}/{site.page_name}"
+    return Path(os.path.abspath(config.get("output_file", "daily_news.html"))).as_uri()
+
+def update_feed(name: str, title: str, new_entries: List[Dict], config: Dict) -> List[str]:
+    """把未出现过的条目加到订阅源最前面 (保留 max_entries 条), 有新条目时重写订阅源文件, 返回写出的文件
+
+    见过的 GUID 与订阅源条目分开保存, 被挤出订阅源的条目仍在榜上时不会再次加入;
+    超过 guid_expiry_days 未再出现的 GUID 被遗忘。
+    """
+    feed_config = config.get("feeds", {})
+    state_path = os.path.join(feed_config.get("state_dir", os.path.join(".cache", "feeds")), f"{name}.json")
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if isinstance(state, list):  # 旧格式: 只有订阅源条目
+        state = {"entries": state, "seen": {entry["guid"]: entry["published"] for entry in state}}
+    entries = state.get("entries", [])
+    seen = state.get("seen", {})
+
+    now = time.time()
+    cutoff = now - feed_config.get("guid_expiry_days", 30) * 86400
+    seen = {guid: last_seen for guid, last_seen in seen.items() if last_seen >= cutoff}
+    dirty = len(seen) != len(state.get("seen", {}))
+    added = []
+    for entry in new_entries:
+        guid = entry["guid"]
+        if guid not in seen:
+            added.append(entry)
+        # 最后出现时间按天更新, 条目持续在榜时状态文件不必每次都重写
+        if now - seen.get(guid, 0) > 86400:
+            seen[guid] = now
+            dirty = True
+    if not added:
+        if dirty:
+            atomic_write(state_path, json.dumps({"entries": entries, "seen": seen}, ensure_ascii=False))
+        return []
+    link = feed_site_link(config)  # 先检查配置, 避免状态已更新而订阅源文件没有写出
+    entries = (added + entries)[:feed_config.get("max_entries", 50)]
+    atomic_write(state_path, json.dumps({"entries": entries, "seen": seen}, ensure_ascii=False))
+
+    feed_dir = feed_config.get("dir", "feeds")
+    updated = max(entry["published"] for entry in added)
+    written = []
+    formats = feed_config.get("formats", ["rss", "atom"])
+    if "rss" in formats:
+        written.append(os.path.join(feed_dir, f"{name}.rss.xml"))
+        write_rss(written[-1], title, link, entries, updated)
+    if "atom" in formats:
+        written.append(os.path.join(feed_dir, f"{name}.atom.xml"))
+        write_atom(written[-1], name, title, link, entries, updated)
+    return written
+
+def write_feeds(data: Dict[str, List], config: Dict, metrics: RunMetrics) -> List[str]:
+    """为每个数据源和所有数据源合并生成订阅源, 返回本次写出的文件"""
+    if not config.get("feeds", {}).get("enabled"):
+        return []
+    now = time.time()
+    written = []
+    combined = []
+    try:
+        with metrics.stage("feeds"):
+            for source, items in data.items():
+                if not items:
+                    continue
+                entries = feed_entries(source, items, now)
+                combined.extend(entries)
+                written += update_feed(source, f"{config['title']} - {SOURCE_FETCHERS[source][0]}", entries, config)
+            if combined:
+                written += update_feed("all", config["title"], combined, config)
+    except (OSError, ValueError) as e:
+        print(f"生成订阅源失败: {e}")
+    metrics.incr("feed_files_written", len(written))
+    return written
+
+# =============== 并发获取引擎 ===============
+# 数据源名称 -> (显示名称, 获取函数, 从 CONFIG[源] 中读取的参数名)
+SOURCE_FETCHERS = {
+    "github": ("GitHub", fetch_github_trending, ("limit", "chinese_only")),
+    "bilibili": ("Bilibili", fetch_bilibili_hot, ("limit", "region")),
+    "weibo": ("Weibo", fetch_weibo_hot, ("limit", "category")),
+    "zhihu": ("Zhihu", fetch_zhihu_hot, ("limit", "category")),
+    "pixiv": ("Pixiv", fetch_pixiv_ranking, ("limit", "mode")),
+}
 
-    if CONFIG["sources"]["pixiv"]:
-        print(" - 获取 Pixiv 数据 (可能较慢或失败)...") # 添加打印信息
-        data["pixiv"] = fetch_pixiv_ranking(
-            limit=CONFIG["pixiv"]["limit"],
-            mode=CONFIG["pixiv"]["mode"]
-        )
-        print(f"   > 获取到 {len(data.get('pixiv', []))} 条 Pixiv 数据") # 添加打印信息
+def get_source_params(source: str, config: Dict) -> Dict:
+    """从配置中取出某个数据源获取函数所需的参数"""
+    _, _, param_names = SOURCE_FETCHERS[source]
+    source_config = config.get(source, {})
+    return {name: source_config[name] for name in param_names if name in source_config}
+
+def build_fetch_tasks(config: Dict) -> Dict[str, Callable[[], Tuple[List, bool]]]:
+    """根据配置生成已启用数据源的获取任务 (启用快照缓存时经由缓存获取), 任务返回 (数据, 是否来自快照)"""
+    snapshot_cache = get_snapshot_cache()
+    tasks = {}
+    for source, (_, fetcher, _) in SOURCE_FETCHERS.items():
+        if not config["sources"].get(source):
+            continue
+        params = get_source_params(source, config)
+        task = lambda fetcher=fetcher, params=params: fetcher(**params)
+        if snapshot_cache is not None:
+            task = lambda source=source, params=params, task=task: snapshot_cache.get(source, params, task)
+        else:
+            task = lambda task=task: (task(), False)
+        tasks[source] = task
+    return tasks
 
-    print("数据获取完毕, 开始生成HTML...") # 添加打印信息
+def _timed_call(task: Callable[[], object]) -> Tuple[object, float]:
+    """执行任务并返回 (结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = task()
+    return result, time.perf_counter() - start
+
+def fetch_all_sources(config: Dict) -> Tuple[Dict[str, List], Dict[str, float], Set[str]]:
+    """并发获取所有已启用的数据源，返回 (数据, 各数据源耗时, 数据来自快照缓存的数据源)
+
+    超过 run_deadline 仍未完成的数据源记为空, 不再等待。截止后获取线程不再发起新请求
+    (包括重试和剩余的图片下载), 进程退出时只需等待正在进行的请求, 而它们的超时也不超过截止时间。
+    """
+    tasks = build_fetch_tasks(config)
+    data = {}
+    timings = {}
+    cached = set()
+    if not tasks:
+        return data, timings, cached
+
+    deadline = config.get("run_deadline")
+    set_run_deadline(deadline)
+    max_workers = max(1, min(config.get("fetch_workers", len(tasks)), len(tasks)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+    futures = {executor.submit(_timed_call, task): source for source, task in tasks.items()}
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            source = futures[future]
+            label = SOURCE_FETCHERS[source][0]
+            try:
+                (data[source], from_cache), timings[source] = future.result()
+                if from_cache:
+                    cached.add(source)
+            except Exception as e:  # 获取函数内部已处理异常，这里兜底
+                print(f"   > 获取 {label} 数据出错: {e}")
+                data[source], timings[source] = [], 0.0
+                continue
+            print(f"   > 获取到 {len(data[source])} 条 {label} 数据 (耗时 {timings[source]:.2f}s)")
+    except FuturesTimeoutError:
+        unfinished = [source for future, source in futures.items() if not future.done()]
+        labels = ", ".join(SOURCE_FETCHERS[source][0] for source in unfinished)
+        print(f"⚠️ 超过运行截止时间 {deadline}s, 未完成的数据源: {labels}, 使用已获取的数据生成页面")
+        for source in unfinished:
+            data[source], timings[source] = [], float(deadline)
+        get_run_metrics().incr("deadline_exceeded", len(unfinished))
+    finally:
+        # 不等待仍在运行的获取线程: 截止后它们不再发起请求, 会很快结束
+        executor.shutdown(wait=False, cancel_futures=True)
+    return data, timings, cached
+
+# =============== 主函数 ===============
+# (主函数保持不变 - 来源于你提供的文件)
+def render_and_write(data: Dict[str, List], config: Dict, metrics: RunMetrics,
+                     statuses: Dict[str, List[str]] = None) -> bool:
+    """生成页面并在内容变化时写入输出文件, 返回是否写入"""
+    # 生成主题样式文件 (内容哈希命名, 已存在则跳过)
+    site = get_live_site()
+    if not config.get("inline_css"):
+        with metrics.stage("stylesheets"):
+            stylesheets = build_theme_stylesheets(config)
+        if site is not None:
+            for path in stylesheets.values():
+                site.publish_file(path, site.options.get("asset_cache_control"), skip_existing=True)
 
     # 生成HTML
-    html_content = generate_html(data, CONFIG)
+    with metrics.stage("render"):
+        html_content = generate_html(data, config, statuses)
+    if site is not None:
+        with metrics.stage("publish"):
+            site.publish_page(html_content)
 
     # 写入文件
-    output_filename = CONFIG["output_file"]
+    output_filename = config["output_file"]
     try:
-        with open(output_filename, "w", encoding="utf-8") as f:
-            f.write(html_content)
-        print(f"🎉 报告已成功生成: {output_filename}") # 修改打印信息
+        with metrics.stage("write"):
+            written = write_if_changed(output_filename, html_content)
+        if written:
+            print(f"🎉 报告已成功生成: {output_filename}") # 修改打印信息
+        else:
+            print(f"报告内容未变化, 跳过写入: {output_filename}")
+        return written
     except IOError as e:
         print(f"❌ 写入文件失败: {e}") # 添加错误处理打印
+        return False
+
+# --- 预压缩 ---
+PRECOMPRESSORS = {
+    "gzip": (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+    "br": (".br", lambda data: brotli.compress(data, quality=11))
+}
+
+def precompress_file(path: str, options: Dict) -> int:
+    """为文件写出 .gz / .br 版本 (已有且不比原文件旧时跳过), 返回写出的文件数"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 0
+    if stat.st_size < options.get("min_size", 0):
+        return 0
+    data = None
+    written = 0
+    for name in options.get("formats", ["gzip", "br"]):
+        if name == "br" and not BROTLI_AVAILABLE:
+            continue
+        suffix, compress = PRECOMPRESSORS[name]
+        try:
+            if os.stat(path + suffix).st_mtime >= stat.st_mtime:
+                continue  # 原文件没有变化
+        except OSError:
+            pass
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        atomic_write(path + suffix, compress(data))
+        written += 1
+    return written
+
+def precompress_artifacts(config: Dict, metrics: RunMetrics) -> None:
+    """为页面、样式文件和订阅源写出预压缩版本 (只处理内容有变化的文件)"""
+    options = config.get("precompress", {})
+    if not options.get("enabled"):
+        return
+    paths = [config["output_file"]]
+    for directory, extension in [(config.get("css_dir", os.path.join("static", "css")), ".css"),
+                                 (config.get("feeds", {}).get("dir", "feeds"), ".xml")]:
+        if os.path.isdir(directory):
+            paths += [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(extension)]
+    written = 0
+    try:
+        with metrics.stage("precompress"):
+            for path in paths:
+                written += precompress_file(path, options)
+    except OSError as e:
+        print(f"写入预压缩文件失败: {e}")
+    metrics.incr("precompressed_files", written)
+
+def export_run_metrics(metrics: RunMetrics, config: Dict) -> None:
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("enabled"):
+        try:
+            metrics.export(metrics_config)
+            if config.get("precompress", {}).get("enabled") and metrics_config.get("json_file"):
+                precompress_file(metrics_config["json_file"], config["precompress"])
+        except OSError as e:
+            print(f"写入运行指标失败: {e}")
+
+def main():
+    metrics = start_run_metrics()
+    print("开始获取数据...") # 添加打印信息
+
+    # 根据配置并发获取数据
+    start = time.perf_counter()
+    data, timings, cached = fetch_all_sources(CONFIG)
+    elapsed = time.perf_counter() - start
+    metrics.add_stage("fetch", elapsed)
+    for source, seconds in timings.items():
+        metrics.add_stage(f"fetch.{source}", seconds)
+        metrics.incr(f"items.{source}", len(data.get(source, [])))
+    if timings:
+        slowest = max(timings, key=timings.get)
+        print(f"数据获取完毕, 总耗时 {elapsed:.2f}s (最慢: {SOURCE_FETCHERS[slowest][0]} {timings[slowest]:.2f}s), 开始生成HTML...")
+    else:
+        print("数据获取完毕, 开始生成HTML...") # 添加打印信息
+
+    # 只归档本次实际获取到的数据, 来自快照缓存的数据已在获取时归档过
+    archive_run({source: items for source, items in data.items() if source not in cached}, metrics)
+    statuses = mark_item_statuses(data, metrics, cached)
+    render_and_write(data, CONFIG, metrics, statuses)
+    write_feeds(data, CONFIG, metrics)
+    precompress_artifacts(CONFIG, metrics)
+    collect_image_garbage(data, CONFIG, metrics)
+
+    # 等待后台刷新的快照写入磁盘, 供下次运行使用; 刷新到的数据同样归档并更新变化标记
+    snapshot_cache = get_snapshot_cache()
+    if snapshot_cache is not None:
+        refreshed = snapshot_cache.wait()
+        archive_run(refreshed, metrics)
+        mark_item_statuses(refreshed, metrics)
+    export_run_metrics(metrics, CONFIG)
+
+# =============== 常驻模式 ===============
+def next_refresh_delay(interval: float, failures: int, daemon_config: Dict) -> float:
+    """计算下一次刷新前的等待时间: 成功时按间隔, 失败时指数退避 (都带随机抖动)"""
+    if failures:
+        retry_delay = daemon_config.get("retry_delay", 30)
+        delay = min(retry_delay * 2 ** (failures - 1), interval, daemon_config.get("max_backoff", 3600))
+    else:
+        delay = interval
+    jitter = daemon_config.get("jitter", 0.0)
+    return max(1.0, delay * (1 + random.uniform(-jitter, jitter)))
+
+def _load_snapshot_data(sources: List[str], config: Dict) -> Dict[str, List]:
+    """启动时先用快照缓存中的数据, 让页面不必等待首次刷新"""
+    snapshot_cache = get_snapshot_cache()
+    data = {}
+    if snapshot_cache is None:
+        return data
+    for source in sources:
+        snapshot = snapshot_cache.load(snapshot_cache.make_key(source, get_source_params(source, config)))
+        if snapshot is not None:
+            data[source] = snapshot[1]
+    return data
+
+def run_daemon(config: Dict, stop_event: threading.Event = None) -> None:
+    """常驻运行: 每个数据源按各自的间隔刷新, 数据有变化 (或日期变化) 时才重新生成页面
+
+    每个数据源独立提交, 完成一个处理一个, 慢的数据源不会推迟其他数据源的刷新。
+    """
+    stop_event = stop_event or threading.Event()
+    daemon_config = config.get("daemon", {})
+    intervals = daemon_config.get("intervals", {})
+    poll_interval = daemon_config.get("poll_interval", 1.0)
+    sources = [source for source in SOURCE_FETCHERS if config["sources"].get(source)]
+    if not sources:
+        print("没有启用任何数据源, 常驻模式退出")
+        return
+
+    data = _load_snapshot_data(sources, config)
+    statuses = {}
+    failures = {source: 0 for source in sources}
+    next_due = {source: 0.0 for source in sources}  # 启动后立即刷新所有数据源
+    in_flight = {}  # future -> (数据源, 参数), 每个数据源同时最多一个
+    rendered_date = None
+    snapshot_cache = get_snapshot_cache()
+    print(f"常驻模式已启动, 数据源: {', '.join(sources)}")
+
+    # 每个数据源一个线程, 正在刷新的数据源不占用其他数据源的线程
+    with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="fetch") as executor:
+        while not stop_event.is_set():
+            running = {source for source, _ in in_flight.values()}
+            for source in sources:
+                if source not in running and next_due[source] <= time.monotonic():
+                    _, fetcher, _ = SOURCE_FETCHERS[source]
+                    params = get_source_params(source, config)
+                    # 每次获取用自己的统计收集器, 完成后并入处理它的那一轮的报告
+                    task = lambda f=fetcher, p=params: _call_with_metrics(lambda: f(**p))
+                    in_flight[executor.submit(_timed_call, task)] = (source, params)
+
+            # 等到有数据源完成或下一个数据源到期 (最长 poll_interval, 以便及时响应退出)
+            idle = [next_due[source] for source in sources if source not in {s for s, _ in in_flight.values()}]
+            timeout = min([poll_interval] + [max(0.0, due - time.monotonic()) for due in idle])
+            if in_flight:
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                stop_event.wait(timeout)
+                done = set()
+
+            today = datetime.now().date()
+            if not done and rendered_date == today:
+                continue
+
+            metrics = start_run_metrics()
+            changed = False
+            fetched = {}
+            for future in done:
+                source, params = in_flight.pop(future)
+                label = SOURCE_FETCHERS[source][0]
+                try:
+                    (items, fetch_metrics), seconds = future.result()
+                    metrics.merge(fetch_metrics)
+                except Exception as e:
+                    items, seconds = [], 0.0
+                    print(f"   > 获取 {label} 数据出错: {e}")
+                metrics.add_stage(f"fetch.{source}", seconds)
+                metrics.incr(f"items.{source}", len(items))
+                if items:
+                    failures[source] = 0
+                    fetched[source] = items
+                    if items != data.get(source):
+                        data[source] = items
+                        statuses.update(mark_item_statuses({source: items}, metrics))
+                        changed = True
+                    if snapshot_cache is not None:
+                        snapshot_cache.save(snapshot_cache.make_key(source, params), items)
+                else:
+                    failures[source] += 1  # 保留上一次的数据
+                interval = intervals.get(source, daemon_config.get("default_interval", 600))
+                delay = next_refresh_delay(interval, failures[source], daemon_config)
+                next_due[source] = time.monotonic() + delay
+                status = f"{len(items)} 条" if items else f"失败 (第 {failures[source]} 次)"
+                print(f"   > [{datetime.now():%H:%M:%S}] {label}: {status}, 耗时 {seconds:.2f}s, {delay:.0f}s 后再次刷新")
+
+            archive_run(fetched, metrics)
+            feed_files = write_feeds(fetched, config, metrics)
+            site = get_live_site()
+            if site is not None:
+                for path in feed_files:
+                    site.publish_file(path, site.options.get("feed_cache_control"))
+            if changed or rendered_date != today:
+                render_and_write(data, config, metrics, statuses)
+                rendered_date = today
+            precompress_artifacts(config, metrics)
+            if "pixiv" in fetched:
+                collect_image_garbage(data, config, metrics)
+            export_run_metrics(metrics, config)
+    print("常驻模式已退出")
+
+# =============== 内置服务器 ===============
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json",
+    ".xml": "application/xml; charset=utf-8",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".svg": "image/svg+xml"
+}
+# 内置服务器可以从 static_dirs 提供的文件类型 (图片库的索引等其他文件不对外提供)
+STATIC_EXTENSIONS = {".css", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"}
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/xml", "application/rss+xml",
+                      "application/atom+xml", "image/svg+xml")
+
+def guess_content_type(path: str) -> str:
+    if path.endswith(".rss.xml"):
+        return "application/rss+xml; charset=utf-8"
+    if path.endswith(".atom.xml"):
+        return "application/atom+xml; charset=utf-8"
+    return CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+class CompressedAsset:
+    """一个响应体及其预先压缩好的 gzip/brotli 版本 (创建后不再修改), 每个版本有各自的强 ETag"""
+
+    def __init__(self, body: bytes, content_type: str, cache_control: str):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {"identity": (body, f'"{digest}"')}
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = (compressed, f'"{digest}-gz"')
+            if BROTLI_AVAILABLE:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = (compressed, f'"{digest}-br"')
+
+    def select(self, accept_encoding: str) -> Tuple[str, bytes, str]:
+        """按 Accept-Encoding 选择版本, 返回 (编码, 响应体, ETag)"""
+        accepted = {}
+        for part in (accept_encoding or "").split(","):
+            name, _, params = part.partition(";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return (encoding, *self.variants[encoding])
+        return ("identity", *self.variants["identity"])
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否与 ETag 匹配 (按规范使用弱比较)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+class LiveSite:
+    """内置服务器提供的内容: URL路径 -> CompressedAsset
+
+    更新时复制映射、修改后整体替换引用, 处理请求的线程读取时无需加锁, 也不会看到更新到一半的页面。
+    """
+
+    def __init__(self, config: Dict, options: Dict):
+        self.options = options
+        self.root = os.path.dirname(os.path.abspath(config.get("output_file", "daily_news.html")))
+        self.page_name = os.path.basename(config.get("output_file", "daily_news.html"))
+        self._assets = {}
+        self._lock = threading.Lock()
+        self._static = OrderedDict()  # URL路径 -> ((mtime_ns, 字节数), CompressedAsset), 最近使用的在后
+        self._static_bytes = 0
+        self._static_lock = threading.Lock()
+
+    def url_for(self, path: str) -> str:
+        return "/" + os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def get(self, url_path: str) -> Optional[CompressedAsset]:
+        return self._assets.get(url_path)
+
+    def publish(self, url_paths: List[str], asset: CompressedAsset) -> None:
+        with self._lock:
+            assets = dict(self._assets)
+            for url_path in url_paths:
+                assets[url_path] = asset
+            self._assets = assets
+
+    def publish_page(self, html_content: str) -> None:
+        """换上新生成的页面 (压缩在替换前完成)"""
+        asset = CompressedAsset(html_content.encode("utf-8"), CONTENT_TYPES[".html"],
+                                self.options.get("page_cache_control", "no-cache"))
+        self.publish(["/", "/" + self.page_name], asset)
+
+    def publish_file(self, path: str, cache_control: str, skip_existing: bool = False) -> None:
+        url_path = self.url_for(path)
+        if skip_existing and url_path in self._assets:
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+        self.publish([url_path], CompressedAsset(body, guess_content_type(path), cache_control))
+
+    def load_static(self, url_path: str) -> Optional[CompressedAsset]:
+        """提供 static_dirs 中的图片和样式文件, 缓存在按大小限制的 LRU 中
+
+        每次请求都检查文件的修改时间和大小, 文件被删除 (如图片库清理) 或修改后缓存随之失效。
+        """
+        parts = url_path.lstrip("/").split("/")
+        if not parts or parts[0] not in self.options.get("static_dirs", []) or ".." in parts:
+            return None
+        path = os.path.join(self.root, *parts)
+        if os.path.splitext(path)[1].lower() not in STATIC_EXTENSIONS:
+            return None
+        try:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(path)
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            with self._static_lock:
+                cached = self._static.get(url_path)
+                if cached is not None and cached[0] == signature:
+                    self._static.move_to_end(url_path)
+                    return cached[1]
+            with open(path, "rb") as f:
+                body = f.read()
+        except OSError:
+            self._cache_static(url_path, None)
+            return None
+        asset = CompressedAsset(body, guess_content_type(path),
+                                self.options.get("static_cache_control", "public, max-age=86400"))
+        self._cache_static(url_path, ((signature[0], len(body)), asset))
+        return asset
+
+    def _cache_static(self, url_path: str, entry: Optional[Tuple[Tuple[int, int], CompressedAsset]]) -> None:
+        """替换 (entry 为 None 时删除) 缓存的磁盘文件, 超过 static_cache_bytes 时淘汰最久未用的"""
+        max_bytes = self.options.get("static_cache_bytes", 64 * 1024 * 1024)
+        with self._static_lock:
+            old = self._static.pop(url_path, None)
+            if old is not None:
+                self._static_bytes -= old[0][1]
+            if entry is None or entry[0][1] > max_bytes:
+                return
+            self._static[url_path] = entry
+            self._static_bytes += entry[0][1]
+            while self._static_bytes > max_bytes:
+                _, ((_, size), _) = self._static.popitem(last=False)
+                self._static_bytes -= size
+
+class SiteRequestHandler(BaseHTTPRequestHandler):
+    """内置服务器的请求处理: 只从内存中取预先压缩好的响应"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body: bool) -> None:
+        site = self.server.site
+        url_path = urlsplit(self.path).path
+        asset = site.get(url_path) or site.load_static(url_path)
+        if asset is None:
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", "9")
+            self.end_headers()
+            if send_body:
+                self.wfile.write(b"not found")
+            return
+        encoding, body, etag = asset.select(self.headers.get("Accept-Encoding"))
+        not_modified = etag_matches(self.headers.get("If-None-Match"), etag)
+        self.send_response(304 if not_modified else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", asset.cache_control)
+        self.send_header("Vary", "Accept-Encoding")
+        if not_modified:
+            self.end_headers()
+            return
+        self.send_header("Content-Type", asset.content_type)
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.site.options.get("verbose"):
+            super().log_message(format, *args)
+
+_live_site = None
+
+def get_live_site() -> Optional[LiveSite]:
+    """内置服务器运行时返回其内容, 否则返回 None"""
+    return _live_site
+
+def start_site_server(config: Dict, options: Dict) -> ThreadingHTTPServer:
+    """在后台线程启动内置服务器, 先提供磁盘上已有的页面和订阅源, 返回服务器对象 (调用 shutdown() 停止)"""
+    global _live_site
+    site = LiveSite(config, options)
+    output_file = config.get("output_file", "daily_news.html")
+    if os.path.exists(output_file):
+        with open(output_file, encoding="utf-8") as f:
+            site.publish_page(f.read())
+    feed_dir = config.get("feeds", {}).get("dir", "feeds")
+    if os.path.isdir(feed_dir):
+        for name in os.listdir(feed_dir):
+            if name.endswith(".xml"):
+                site.publish_file(os.path.join(feed_dir, name), options.get("feed_cache_control"))
+    css_dir = config.get("css_dir", os.path.join("static", "css"))
+    if os.path.isdir(css_dir):
+        for name in os.listdir(css_dir):
+            if name.endswith(".css"):
+                site.publish_file(os.path.join(css_dir, name), options.get("asset_cache_control"))
+    _live_site = site
+
+    server = ThreadingHTTPServer((options.get("host", "127.0.0.1"), options.get("port", 8080)), SiteRequestHandler)
+    server.daemon_threads = True
+    server.site = site
+    threading.Thread(target=server.serve_forever, name="site-server", daemon=True).start()
+    return server
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="每日热门内容聚合")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行, 按各数据源的间隔定时刷新")
+    parser.add_argument("--serve", action="store_true", help="常驻运行并用内置服务器提供页面 (内存中预压缩, 支持304)")
+    parser.add_argument("--record", metavar="DIR", help="把收到的所有上游响应录制到 DIR")
+    parser.add_argument("--base-url", help="所有请求改发到该地址, 例如 http://127.0.0.1:8800")
+    parser.add_argument("--replay-server", metavar="DIR", help="启动本地回放服务器, 提供 DIR 中录制的响应")
+    parser.add_argument("--host", help="回放服务器或内置服务器的监听地址")
+    parser.add_argument("--port", type=int, help="回放服务器或内置服务器的端口")
+    parser.add_argument("--latency", type=float, help="回放服务器人为延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, help="延迟的随机抖动范围 (毫秒)")
+    parser.add_argument("--error-rate", type=float, help="回放服务器随机返回错误的比例 (0~1)")
+    parser.add_argument("--verbose", action="store_true", help="回放服务器打印每个请求")
+    parser.add_argument("--history", nargs=2, metavar=("SOURCE", "KEY"),
+                        help="查询历史归档中某个条目的排名变化, KEY 为仓库名/bvid/热搜词/问题ID/作品ID")
+    parser.add_argument("--days", type=float, default=7, help="--history 查询的天数 (默认7天)")
+    return parser.parse_args(argv)
+
+def cli(argv: List[str] = None):
+    args = parse_args(argv)
+    if args.record:
+        CONFIG["record_dir"] = args.record
+    if args.base_url:
+        CONFIG["base_url"] = args.base_url
+
+    if args.replay_server:
+        options = dict(CONFIG["replay_server"], verbose=args.verbose)
+        for key, value in [("host", args.host), ("port", args.port), ("latency_ms", args.latency),
+                           ("jitter_ms", args.jitter), ("error_rate", args.error_rate)]:
+            if value is not None:
+                options[key] = value
+        server = start_replay_server(args.replay_server, options)
+        print(f"回放服务器已启动: http://{options['host']}:{server.server_port} (目录: {args.replay_server}), 按 Ctrl+C 退出")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    if args.history:
+        archive = get_run_archive()
+        if archive is None:
+            print("历史归档未启用")
+            return
+        source, key = args.history
+        rows = archive.rank_history(source, key, since=time.time() - args.days * 86400)
+        for fetched_at, rank in rows:
+            print(f"{datetime.fromtimestamp(fetched_at):%Y-%m-%d %H:%M}  #{rank}")
+        if not rows:
+            print(f"最近 {args.days:g} 天内没有 {source}/{key} 的记录")
+        return
+
+    if args.daemon or args.serve:
+        server = None
+        if args.serve:
+            options = dict(CONFIG["serve"])
+            options["verbose"] = options.get("verbose") or args.verbose
+            for key, value in [("host", args.host), ("port", args.port)]:
+                if value is not None:
+                    options[key] = value
+            server = start_site_server(CONFIG, options)
+            print(f"内置服务器已启动: http://{options['host']}:{server.server_port}/")
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+        try:
+            run_daemon(CONFIG, stop_event)
+        except KeyboardInterrupt:
+            stop_event.set()
+        finally:
+            if server is not None:
+                server.shutdown()
+        return
+
+    main()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()